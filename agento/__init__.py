@@ -1,2 +1,7 @@
 from agento.agent import Agent, ChatMessage
 from agento.utils import print_history
+from agento.scheduler import Priority, set_rate_limits, scheduler_metrics
+from agento.router import Router
+from agento.memory import MemoryProfiler
+from agento.workers import LocalQueue, SocketQueue, SocketQueueServer, Worker, remote_agent
+from agento.store import ObjectStore
@@ -1,9 +1,14 @@
-from typing import List, Callable
+from typing import List, Callable, Dict, Any, Tuple, Optional
+from contextlib import nullcontext
 import json
 
-from agento.settings import DEBUG
-from agento.engine import execute_python_code, process_results
-from agento.client import ChatMessage, ChatCompletionMessage, chat, add_messages_to_history
+from agento.settings import DEBUG, SCHEMA_ENCODING, SCHEMA_SUMMARY_ONLY
+from agento.engine import TranscriptCollector, execute_python_code, process_results
+from agento.client import ChatMessage, ChatCompletionMessage, chat, chat_candidates, add_messages_to_history
+from agento.scheduler import Priority
+from agento.router import Router
+from agento.memory import MemoryProfiler
+from agento.store import ObjectStore
 from agento.utils import extract_python_code, load_system_prompt, create_functions_schema, format_agent_name
 
 # Type alias for the process function
@@ -17,6 +22,13 @@ def Agent(
         functions: List[Callable] = [],
         history: List[ChatMessage] = [],
         team: List[AgentFunction] = [],
+        priority: Priority = Priority.INTERACTIVE,
+        candidates: int = 1,
+        router: Router = None,
+        memory_profiler: MemoryProfiler = None,
+        schema_encoding: str = SCHEMA_ENCODING,
+        schema_summary_only: bool = SCHEMA_SUMMARY_ONLY,
+        parallel_tools: bool = False,
     ):
     """
     Function to create an agent. The process() function 
@@ -33,28 +45,79 @@ def Agent(
         functions (List[Callable]): The functions that the agent can call.
         history (List[ChatMessage]): The history of the conversation.
         team (List[AgentFunction]): The team of agents.
+        priority (Priority): The priority class of the agent's completion requests.
+        candidates (int): The number of candidate responses to request per turn, the first one whose code executes without errors is used.
+        Candidates are executed one by one until one succeeds, so the function calls of the failing candidates have run for real. 
+        Only use it with side-effect free functions. It is not supported for agents with a team, as failing candidates would 
+        run sub-agent conversations whose transcripts are discarded.
+        router (Router): The router dispatching known tasks straight to a team member, skipping the orchestrator's round trip.
+        memory_profiler (MemoryProfiler): The profiler to attribute the memory of the agent's turns and code executions to.
+        schema_encoding (str): The encoding of the functions schema in the system prompt: json, compact or stub.
+        schema_summary_only (bool): Whether to only keep the summary of the docstrings in the functions schema.
+        parallel_tools (bool): Whether to run independent consecutive function calls of a code block concurrently,
+            only calls with immutable arguments are batched and transfers to the team always run sequentially.
 
     Returns:
         Callable: A function representing the agent.
     """
+
+    if candidates > 1 and len(team) > 0:
+        raise ValueError("Agents with a team do not support candidates > 1, failing candidates would run unrecorded sub-agent conversations.")
+
+    # Create a map of agent names to their process functions
+    agents_map = {format_agent_name(agent.__name__): agent for agent in team}
+
+    # Create a map of session ids to the stores of their large context variables
+    session_stores: Dict[str, ObjectStore] = {}
     
-    def create_transfer_function(team: List[AgentFunction]) -> Callable:
+    def call_team_member(agent_name: str, task: str, context_variables = None, session_id: str = None) -> List[ChatMessage]:
+        """
+        Run the task on a team member within the session of the calling agent.
+
+        Args:
+            agent_name (str): The name of the team member.
+            task (str): The task to run.
+            context_variables: The context variables to pass to the team member.
+            session_id (str): The id of the session of the calling agent.
+
+        Returns:
+            List[ChatMessage]: The history of the team member after processing the task.
+        """
+        if session_id is None:
+            return agents_map[agent_name](task=task, context_variables=context_variables)
+        return agents_map[agent_name](task=task, context_variables=context_variables, session_id=session_id)
+
+    def turn_messages(result: List[ChatMessage]) -> List[ChatMessage]:
+        """
+        Get the messages a team member produced for its task, which follow 
+        the prompt messages it marked.
+
+        Args:
+            result (List[ChatMessage]): The history returned by the team member.
+
+        Returns:
+            List[ChatMessage]: The messages produced for the task.
+        """
+        start = next((i + 1 for i in range(len(result) - 1, -1, -1) if result[i].prompt), 0)
+        return result[start:]
+
+    def create_transfer_function(
+            team: List[AgentFunction], 
+            transcripts: TranscriptCollector = None, 
+            session_id: str = None
+        ) -> Callable:
         """
         Create the transfer functions. Used for an agent 
         with a team to transfer the task to the next agent.
 
         Args:
             team (List[AgentFunction]): The team of agents.
+            transcripts (TranscriptCollector, optional): The collector to report the sub-agent histories to.
+            session_id (str, optional): The id of the session the sub-agents run in.
 
         Returns:
             List[Callable]: The transfer functions.
         """
-        
-        # Create a map of agent names to their response functions
-        agents_map = {
-            format_agent_name(agent.__name__): lambda task, context: agent(task=task, context_variables=context) for agent in team
-        }
-
         # Create a string of available agent names
         available_agents = ", ".join(agents_map.keys())
 
@@ -62,6 +125,7 @@ def Agent(
             """
             Transfer the task to the agent with the 
             given name and return the agent's response.
+            Available agent(s): {available_agents}.
 
             Args:
                 task (str): The task to transfer.
@@ -73,15 +137,18 @@ def Agent(
                 str: The agent's response to the task.
                 list[ChatMessage]: The history of the transfer agent after processing the task.
             """
-            result = agents_map[agent_name](task, context_variables)
-            return result[-1].message.content, result
+            result = call_team_member(agent_name, task, context_variables, session_id)
+            returned = (result[-1].message.content, result)
+            if transcripts is not None:
+                transcripts.record(agent_name, turn_messages(result), returned, result)
+            return returned
         
         # Set the name and docstring of the transfer function
         transfer_to_agent.__doc__ = transfer_to_agent.__doc__.replace("{available_agents}", available_agents)
 
         return transfer_to_agent
 
-    def init_or_update_history(task: str, history: List[ChatMessage], context_variables = None):
+    def init_or_update_history(task: str, history: List[ChatMessage], context_variables = None, store: ObjectStore = None):
         """
         If the history is empty, create a new history with the system prompt.
         If the history is not empty, update the history with the user query.
@@ -89,6 +156,8 @@ def Agent(
         Args:
             task (str): The user query.
             history (List[ChatMessage]): The history of the conversation.
+            context_variables: The context variables to render into the system prompt.
+            store (ObjectStore): The store the large context variables are kept in.
 
         Returns:
             List[ChatMessage]: The updated history.
@@ -96,9 +165,9 @@ def Agent(
         if not history or not isinstance(history, list) or not len(history) > 0:
             if len(team) > 0:
                 # Add transfer functions to the functions
-                functions_schema = create_functions_schema(functions + [create_transfer_function(team)])
+                functions_schema = create_functions_schema(functions + [create_transfer_function(team)], schema_encoding, schema_summary_only)
             else:
-                functions_schema = create_functions_schema(functions)
+                functions_schema = create_functions_schema(functions, schema_encoding, schema_summary_only)
 
             # Load the system prompt
             if context_variables:
@@ -106,7 +175,8 @@ def Agent(
                     functions_schema=functions_schema,
                     instructions=instructions,
                     context_variables=context_variables,
-                    is_orchestrator=True if len(team) > 0 else False
+                    is_orchestrator=True if len(team) > 0 else False,
+                    store=store
                 )
             else:
                 system_prompt = load_system_prompt(
@@ -117,43 +187,152 @@ def Agent(
             history = [
                 ChatMessage(
                     sender="system", 
-                    message=ChatCompletionMessage(role="system", content=system_prompt)
+                    message=ChatCompletionMessage(role="system", content=system_prompt),
+                    prompt=True
                 )
             ]
         if task:
-            history.append(ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content=task)))
+            history.append(ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content=task), prompt=True))
         return history
 
-    def process(
-            task: str = "",
-            history: List[ChatMessage] = history,
+    def execute(code: str, context_variables = None, session_id: str = None) -> Tuple[Dict[str, Any], TranscriptCollector]:
+        """
+        Execute the code of a response with the agent's functions.
+
+        Args:
+            code (str): The code to execute.
+            context_variables: The context variables to make available to the code.
+            session_id (str): The id of the session, passed on to the team members.
+
+        Returns:
+            Tuple[Dict[str, Any], TranscriptCollector]: The results of the execution and the collected sub-agent transcripts.
+        """
+        transcripts = TranscriptCollector()
+        with memory_profiler.track(execution=True) if memory_profiler else nullcontext():
+            results = execute_python_code(
+                code=code, 
+                functions=functions if len(team) == 0 else functions + [create_transfer_function(team, transcripts, session_id)], 
+                context_variables=context_variables,
+                parallel=parallel_tools
+            )
+        return results, transcripts
+
+    def respond_and_execute(
+            history: List[ChatMessage], 
             context_variables = None,
-            debug: bool = DEBUG
+            session_id: str = None
+        ) -> Tuple[str, Optional[Dict[str, Any]], Optional[TranscriptCollector]]:
+        """
+        Get the response from the chat client and execute its code. 
+        If candidates > 1, the candidates are requested concurrently and 
+        the first one whose code compiles and executes without errors is 
+        taken, the remaining requests are cancelled. If no candidate 
+        succeeds, the first completed one is used.
+
+        Args:
+            history (List[ChatMessage]): The history of the conversation.
+            context_variables: The context variables to make available to the code.
+            session_id (str): The id of the session, passed on to the team members.
+
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]], Optional[TranscriptCollector]]: The response, and the results 
+            and transcripts of its code, which are None if the response contains no code.
+        """
+        if candidates <= 1:
+            response = chat(history, model, provider, priority)
+            code, is_code = extract_python_code(response)
+            return (response, *execute(code, context_variables, session_id)) if is_code else (response, None, None)
+
+        fallback = None
+        responses = chat_candidates(history, model, provider, candidates, priority)
+        try:
+            for response in responses:
+                code, is_code = extract_python_code(response)
+                if not is_code:
+                    return response, None, None
+
+                # Dry-validate the code before running any function
+                try:
+                    compile(code, "<candidate>", "exec")
+                except SyntaxError:
+                    fallback = fallback or (response, code, None)
+                    continue
+
+                results, transcripts = execute(code, context_variables, session_id)
+                if not results["errors"]:
+                    return response, results, transcripts
+                fallback = fallback or (response, code, (results, transcripts))
+        finally:
+            responses.close()
+
+        response, code, executed = fallback
+        return (response, *(executed or execute(code, context_variables, session_id)))
+
+    def dispatch(
+            agent_name: str, 
+            task: str, 
+            history: List[ChatMessage], 
+            context_variables = None,
+            session_id: str = None
         ) -> List[ChatMessage]:
         """
-        Process the user query and update the history 
-        using agent: {name}.
+        Run the task on a team member directly and add its 
+        transcript and answer to the history.
 
-        The process is as follows:  
-        1. The history is initialized with the system prompt and the user query or updated with the user query.
-        2. The response is generated from the chat client using agent: {name}.
-        3. The Python code is extracted from the response.
-        4. The code is executed and the results are added to the history as a new user message containing the function results.
-        5. The response is generated from the chat client using agent: {name}.
+        Args:
+            agent_name (str): The name of the team member.
+            task (str): The user query.
+            history (List[ChatMessage]): The history of the conversation, ending with the user query.
+            context_variables: The context variables to pass to the team member.
+            session_id (str): The id of the session, passed on to the team member.
+
+        Returns:
+            List[ChatMessage]: The updated history.
+        """
+        result = call_team_member(agent_name, task, context_variables, session_id)
+        chat_messages = [ChatMessage(sender=chat_message.sender, message=chat_message.message, include_in_chat=False) for chat_message in turn_messages(result)]
+        history = add_messages_to_history(history, chat_messages)
+        history.append(ChatMessage(sender=name, message=ChatCompletionMessage(role="assistant", content=result[-1].message.content)))
+        return history
+
+    def run(
+            task: str,
+            history: List[ChatMessage],
+            context_variables = None,
+            debug: bool = DEBUG,
+            store: ObjectStore = None,
+            session_id: str = None
+        ) -> List[ChatMessage]:
+        """
+        Run a turn of the agent, as described in process().
 
         Args:
             task (str): The user query.
             history (List[ChatMessage]): The history of the conversation.
+            context_variables: The context variables passed to the agent.
+            debug (bool): Whether to print debug information.
+            store (ObjectStore): The store of the large context variables of the session.
+            session_id (str): The id of the session, passed on to the team members.
 
         Returns:
             List[ChatMessage]: The updated history.
         """
-        
         # Initialize or update the history
-        history = init_or_update_history(task, history, context_variables)
-
-        # Get the response from the chat client
-        response = chat(history, model, provider)
+        history = init_or_update_history(task, history, context_variables, store)
+
+        # Dispatch the task straight to a team member if the router knows where it goes
+        if router is not None and task and len(team) > 0:
+            agent_name = router.route(task, agents_map.keys())
+            if agent_name is not None:
+                if debug:
+                    print("-"*50)
+                    print(f"Sender: {name}")
+                    print(f"Routed to: {agent_name}")
+                    print("-"*50)
+                return dispatch(agent_name, task, history, context_variables, session_id)
+
+        # Get the response from the chat client and execute its code
+        response, results, transcripts = respond_and_execute(history, context_variables, session_id)
 
         if debug:
             print("-"*50)
@@ -162,19 +341,17 @@ def Agent(
             print(f"Context variables:\n{context_variables}") 
             print("-"*50)
 
-        # Extract the Python code from the response
-        code, is_code = extract_python_code(response)
-
-        # If the response contains code, execute the code
-        if is_code:
-            results = execute_python_code(
-                code=code, 
-                functions=functions if len(team) == 0 else functions + [create_transfer_function(team)], 
-                context_variables=context_variables
-            )
+        # If the response contained code, add the results to the history
+        if results is not None:
+            # Cache the routing decision if the orchestrator only transferred the task, and it succeeded
+            if (
+                router is not None and task and not results["errors"] and
+                len(transcripts.agents) == 1 and set(results["function_results"]) == {"transfer_to_agent"}
+            ):
+                router.learn(task, transcripts.agents[0])
 
             # Process the results
-            results, chat_messages = process_results(results)
+            results, chat_messages = process_results(results, transcripts, store)
 
             # Convert the results to a JSON string
             results = json.dumps(results, indent=2)
@@ -194,13 +371,60 @@ def Agent(
             ))
 
             # Get the response from the chat client
-            response = chat(history, model, provider)
+            response = chat(history, model, provider, priority)
             history.append(ChatMessage(sender=name, message=ChatCompletionMessage(role="assistant", content=response)))
 
         # Return the history
         return history
 
+    def process(
+            task: str = "",
+            history: List[ChatMessage] = history,
+            context_variables = None,
+            debug: bool = DEBUG,
+            session_id: str = None
+        ) -> List[ChatMessage]:
+        """
+        Process the user query and update the history 
+        using agent: {name}.
+
+        The process is as follows:  
+        1. The history is initialized with the system prompt and the user query or updated with the user query.
+           If the router knows the team member for the query, the query is dispatched to it and the process ends here.
+        2. The response is generated from the chat client using agent: {name}, best of the candidates if candidates > 1.
+        3. The Python code is extracted from the response.
+        4. The code is executed and the results are added to the history as a new user message containing the function results.
+        5. The response is generated from the chat client using agent: {name}.
+
+        Args:
+            task (str): The user query.
+            history (List[ChatMessage]): The history of the conversation.
+            session_id (str): The id of the session, its large context variables are stored per session and 
+            shown to the model as handles until the session is forgotten with process.forget_session(), and 
+            the memory of the turn is attributed to it if memory profiling is enabled.
+
+        Returns:
+            List[ChatMessage]: The updated history.
+        """
+        with memory_profiler.track(name, session_id) if memory_profiler else nullcontext():
+            store = session_stores.setdefault(session_id, ObjectStore()) if session_id is not None else None
+            return run(task, history, context_variables, debug, store, session_id)
+
+    def forget_session(session_id: str) -> None:
+        """
+        Release the large context variables stored for a finished session,
+        by the agent and by the team members it passed them on to.
+
+        Args:
+            session_id (str): The id of the session.
+        """
+        session_stores.pop(session_id, None)
+        for agent in agents_map.values():
+            if hasattr(agent, "forget_session"):
+                agent.forget_session(session_id)
+
     # Set the name and docstring of the process function
     process.__name__ = format_agent_name(name)
     process.__doc__ = process.__doc__.replace("\{name\}", format_agent_name(name))
+    process.forget_session = forget_session
     return process
\ No newline at end of file
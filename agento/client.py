@@ -1,9 +1,13 @@
-from typing import List
+from typing import List, Iterator
 from pydantic import BaseModel
+import threading
+import asyncio
+import queue
 
 import openai
 
-from agento.settings import PROVIDER_URLS
+from agento.settings import PROVIDER_URLS, PROVIDERS_SUPPORTING_N
+from agento.scheduler import Priority, get_scheduler
 
 class ChatCompletionMessage(BaseModel):
     """Wrapper class for a chat message."""
@@ -15,21 +19,48 @@ class ChatMessage(BaseModel):
     sender: str
     message: ChatCompletionMessage
     include_in_chat: bool = True
+    # Whether the message is the system prompt or task the agent was given, rather than one it produced
+    prompt: bool = False
 
-def chat(messages: List[ChatMessage], model: str, provider: str) -> str:
+def estimate_tokens(text: str) -> int:
     """
-    Get a chat completion from the specified provider.
+    Estimate the token count of the given text, using
+    roughly four characters per token.
+
+    Args:
+        text (str): The text to estimate the token count of.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return (len(text) + 3) // 4
+
+def complete(
+        messages: List[ChatMessage], 
+        model: str, 
+        provider: str, 
+        priority: Priority = Priority.INTERACTIVE,
+        n: int = 1
+    ) -> List[str]:
+    """
+    Get one or more chat completions from the specified provider with 
+    a single request. The request waits for the rate limits of the 
+    provider, in order of priority.
 
     Args:
         messages (List[ChatMessage]): The messages to send to the client.
         model (str): The model to use for the completion.
         provider (str): The provider to use for the completion. Available options: lm_studio, ollama, vllm, openrouter.
+        priority (Priority): The priority class of the request.
+        n (int): The number of completions to request, only supported by the providers in PROVIDERS_SUPPORTING_N.
 
     Returns:
-        str: The content of the response from the provider.
+        List[str]: The contents of the responses from the provider.
     """
     if provider not in PROVIDER_URLS:
         raise ValueError(f"Provider {provider} not supported. Available providers: {', '.join(PROVIDER_URLS.keys())}")
+    if n > 1 and provider not in PROVIDERS_SUPPORTING_N:
+        raise ValueError(f"Provider {provider} does not support n > 1. Supported providers: {', '.join(PROVIDERS_SUPPORTING_N)}")
     
     base_url, api_key = PROVIDER_URLS[provider]
     
@@ -37,14 +68,187 @@ def chat(messages: List[ChatMessage], model: str, provider: str) -> str:
         api_key=api_key,
         base_url=base_url,
     )
+
+    messages = [message.message.model_dump() for message in messages if message.include_in_chat]
+
+    # Wait for the rate limits of the provider
+    scheduler = get_scheduler(provider)
+    estimated_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    scheduler.acquire(priority, estimated_tokens)
     
     response = client.chat.completions.create(
         model=model,
-        messages=[message.message.model_dump() for message in messages if message.include_in_chat]
+        messages=messages,
+        **({"n": n} if n > 1 else {})
     )
+
+    # Correct the token bucket with the reported usage
+    if response.usage is not None:
+        scheduler.settle(estimated_tokens, response.usage.total_tokens)
     
+    return [choice.message.content for choice in response.choices]
+
+def chat(
+        messages: List[ChatMessage], 
+        model: str, 
+        provider: str, 
+        priority: Priority = Priority.INTERACTIVE
+    ) -> str:
+    """
+    Get a chat completion from the specified provider.
+
+    Args:
+        messages (List[ChatMessage]): The messages to send to the client.
+        model (str): The model to use for the completion.
+        provider (str): The provider to use for the completion. Available options: lm_studio, ollama, vllm, openrouter.
+        priority (Priority): The priority class of the request.
+
+    Returns:
+        str: The content of the response from the provider.
+    """
+    return complete(messages, model, provider, priority)[0]
+
+async def complete_cancellable(
+        messages: List[ChatMessage], 
+        model: str, 
+        provider: str, 
+        priority: Priority,
+        cancelled: threading.Event
+    ) -> str:
+    """
+    Get a chat completion from the specified provider with the async client,
+    so that cancelling the coroutine aborts the request and drops its connection.
+    A cancelled request is neither charged nor counted by the scheduler, if it 
+    is still waiting for the rate limits it leaves the queue without being sent. The cancelled event has to be set through 
+    the scheduler's cancel() before the coroutine is cancelled.
+
+    Args:
+        messages (List[ChatMessage]): The messages to send to the client.
+        model (str): The model to use for the completion.
+        provider (str): The provider to use for the completion. Available options: lm_studio, ollama, vllm, openrouter.
+        priority (Priority): The priority class of the request.
+        cancelled (threading.Event): Set when the request is no longer needed.
+
+    Returns:
+        str: The content of the response from the provider.
+    """
+    if provider not in PROVIDER_URLS:
+        raise ValueError(f"Provider {provider} not supported. Available providers: {', '.join(PROVIDER_URLS.keys())}")
+
+    base_url, api_key = PROVIDER_URLS[provider]
+    messages = [message.message.model_dump() for message in messages if message.include_in_chat]
+
+    # Wait for the rate limits of the provider, the waiting thread returns once the request is cancelled
+    scheduler = get_scheduler(provider)
+    estimated_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    acquiring = asyncio.ensure_future(asyncio.to_thread(scheduler.acquire, priority, estimated_tokens, cancelled))
+    try:
+        waited = await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        if await acquiring is not None:
+            scheduler.release(priority, estimated_tokens)
+        raise
+    if waited is None:
+        raise asyncio.CancelledError()
+    if cancelled.is_set():
+        scheduler.release(priority, estimated_tokens)
+        raise asyncio.CancelledError()
+
+    # Aborted requests get no response, so they are not charged either
+    try:
+        async with openai.AsyncClient(api_key=api_key, base_url=base_url) as client:
+            response = await client.chat.completions.create(model=model, messages=messages)
+    except asyncio.CancelledError:
+        scheduler.release(priority, estimated_tokens)
+        raise
+
+    # Correct the token bucket with the reported usage
+    if response.usage is not None:
+        scheduler.settle(estimated_tokens, response.usage.total_tokens)
+
     return response.choices[0].message.content
 
+def chat_candidates(
+        messages: List[ChatMessage], 
+        model: str, 
+        provider: str, 
+        n: int,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Iterator[str]:
+    """
+    Get n candidate chat completions from the specified provider, 
+    yielded in the order they finish. Providers in PROVIDERS_SUPPORTING_N 
+    get a single request with the `n` parameter, other providers get n 
+    concurrent requests on an event loop in a background thread. Closing 
+    the iterator early cancels the remaining requests: the ones in flight 
+    are aborted and the ones still waiting for the rate limits leave the 
+    queue without being sent or charged. Failed requests are skipped unless all of them fail.
+
+    Args:
+        messages (List[ChatMessage]): The messages to send to the client.
+        model (str): The model to use for the completion.
+        provider (str): The provider to use for the completion. Available options: lm_studio, ollama, vllm, openrouter.
+        n (int): The number of candidates to request.
+        priority (Priority): The priority class of the requests.
+
+    Yields:
+        str: The content of each candidate response.
+    """
+    if provider in PROVIDERS_SUPPORTING_N:
+        yield from complete(messages, model, provider, priority, n=n)
+        return
+
+    scheduler = get_scheduler(provider)
+    finished = queue.Queue()
+    cancelled = threading.Event()
+    loop = asyncio.new_event_loop()
+    tasks = []
+
+    async def request():
+        try:
+            finished.put((True, await complete_cancellable(messages, model, provider, priority, cancelled)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            finished.put((False, e))
+
+    async def run_requests():
+        tasks.extend(asyncio.ensure_future(request()) for _ in range(n))
+        if cancelled.is_set():
+            cancel_requests()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel_requests():
+        for task in tasks:
+            task.cancel()
+
+    def run_loop():
+        try:
+            loop.run_until_complete(run_requests())
+        finally:
+            loop.close()
+
+    threading.Thread(target=run_loop, daemon=True).start()
+    try:
+        errors = []
+        for _ in range(n):
+            # A failed request only fails the iteration if every candidate failed
+            succeeded, value = finished.get()
+            if not succeeded:
+                errors.append(value)
+                continue
+            yield value
+        if len(errors) == n:
+            raise errors[0]
+    finally:
+        # Drop the requests waiting for the rate limits, then abort the ones in flight
+        scheduler.cancel(cancelled)
+        # The loop is closed once every request is done, then there is nothing left to cancel
+        try:
+            loop.call_soon_threadsafe(cancel_requests)
+        except RuntimeError:
+            pass
+
 def add_messages_to_history(history: List[ChatMessage], messages: List[ChatMessage]) -> List[ChatMessage]:
     """
     Add messages to the history. This method is used to 
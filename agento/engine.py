@@ -1,12 +1,186 @@
-from typing import List, Callable, Dict, Any, Tuple
+from typing import List, Callable, Dict, Any, Tuple, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import ast
 
 from agento.client import ChatMessage
+from agento.store import ObjectStore
+
+class TranscriptCollector:
+    """
+    Side-channel for the sub-agent transcripts produced while a 
+    code block is executed. The transfer function records every 
+    sub-agent history here, so the executing agent can merge them 
+    without scanning the variables defined by the code.
+    """
+    def __init__(self):
+        self.messages: List[ChatMessage] = []
+        self.agents: List[str] = []
+        self._returned_ids = set()
+
+    def record(self, agent_name: str, messages: List[ChatMessage], *returned: Any) -> None:
+        """
+        Record the messages of a sub-agent run.
+
+        Args:
+            agent_name (str): The name of the sub-agent.
+            messages (List[ChatMessage]): The messages the sub-agent produced for the task.
+            *returned (Any): The objects handed back to the code, so they can be dropped from the variables.
+        """
+        self.messages.extend(messages)
+        self.agents.append(agent_name)
+        self._returned_ids.update(id(obj) for obj in returned)
+
+    def owns(self, obj: Any) -> bool:
+        """
+        Check if the object was handed back to the code by a recorded transfer.
+
+        Args:
+            obj (Any): The object to check.
+
+        Returns:
+            bool: True if the object is a recorded transfer return value, False otherwise.
+        """
+        return id(obj) in self._returned_ids
+
+def find_call_dependencies(stmt: ast.stmt, function_names: Set[str]) -> Optional[Tuple[Set[str], Set[str]]]:
+    """
+    Check if the statement is an assignment of a single call to one of 
+    the available functions, like `a, b = func(x, key=y)`, whose arguments 
+    contain no further calls.
+
+    Args:
+        stmt (ast.stmt): The statement to check.
+        function_names (Set[str]): The names of the available functions.
+
+    Returns:
+        Optional[Tuple[Set[str], Set[str]]]: The names the statement assigns and the names it reads, 
+        or None if the statement is not such a call.
+    """
+    if not isinstance(stmt, ast.Assign) or not isinstance(stmt.value, ast.Call):
+        return None
+    call = stmt.value
+    if not isinstance(call.func, ast.Name) or call.func.id not in function_names:
+        return None
+
+    # Only plain names can be assigned, attributes and subscripts may alias other objects
+    targets = set()
+    for target in stmt.targets:
+        for node in ast.walk(target):
+            if isinstance(node, ast.Name):
+                targets.add(node.id)
+            elif not isinstance(node, (ast.Tuple, ast.List, ast.Starred, ast.expr_context)):
+                return None
+
+    # Arguments are evaluated ahead of the earlier calls, so they must not have side effects
+    arguments = call.args + [keyword.value for keyword in call.keywords]
+    for node in (node for argument in arguments for node in ast.walk(argument)):
+        if isinstance(node, (ast.Call, ast.NamedExpr, ast.Await, ast.Yield, ast.YieldFrom)):
+            return None
+
+    reads = {node.id for node in ast.walk(call) if isinstance(node, ast.Name)}
+    return targets, reads
+
+def is_immutable(value: Any) -> bool:
+    """
+    Check if the value is immutable, so that concurrent calls cannot 
+    observe each other's changes to it.
+
+    Args:
+        value (Any): The value to check.
+
+    Returns:
+        bool: True for None, numbers, strings, bytes and tuples or frozensets of immutable values.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, range)):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(is_immutable(item) for item in value)
+    return False
+
+def execute_parallel(code: str, env: Dict[str, Any], function_names: Set[str], max_workers: int = None) -> None:
+    """
+    Execute Python code in the given environment, running consecutive calls 
+    to the available functions concurrently on a thread pool when none of 
+    them reads or assigns a name another one assigns and all their arguments 
+    are immutable, since calls sharing a mutable object may depend on each 
+    other through it. The results are bound 
+    to the same variable names, in statement order, as sequential execution 
+    would. If a call raises, the results of the calls before it are bound 
+    and the exception is raised, the calls after it have still run.
+
+    Args:
+        code (str): The Python code to execute.
+        env (Dict[str, Any]): The execution environment.
+        function_names (Set[str]): The names of the functions that can be run concurrently.
+        max_workers (int, optional): The maximum number of concurrent calls.
+    """
+    def run_statements(statements: List[ast.stmt]) -> None:
+        exec(compile(ast.Module(body=statements, type_ignores=[]), "<string>", "exec"), env)
+
+    def run_batch(batch: List[ast.Assign]) -> None:
+        if len(batch) == 1:
+            run_statements(batch)
+            return
+
+        # Evaluate the arguments in statement order, then run the calls concurrently
+        arguments = []
+        env["__agento_capture__"] = lambda *args, **kwargs: (args, kwargs)
+        try:
+            for stmt in batch:
+                capture = ast.Call(func=ast.Name(id="__agento_capture__", ctx=ast.Load()), args=stmt.value.args, keywords=stmt.value.keywords)
+                expression = ast.fix_missing_locations(ast.Expression(body=ast.copy_location(capture, stmt.value)))
+                arguments.append(eval(compile(expression, "<string>", "eval"), env))
+        except Exception:
+            # The calls before the failing arguments still run, as in sequential execution
+            run_statements(batch)
+            return
+
+        # Calls sharing a mutable argument run sequentially, the arguments have no side effects to repeat
+        if not all(is_immutable(value) for args, kwargs in arguments for value in (*args, *kwargs.values())):
+            run_statements(batch)
+            return
+        futures = [executor.submit(env[stmt.value.func.id], *args, **kwargs) for stmt, (args, kwargs) in zip(batch, arguments)]
+
+        # Bind the results to the targets of the statements
+        for stmt, future in zip(batch, futures):
+            env["__agento_result__"] = future.result()
+            assign = ast.Assign(targets=stmt.targets, value=ast.Name(id="__agento_result__", ctx=ast.Load()))
+            run_statements([ast.fix_missing_locations(ast.copy_location(assign, stmt))])
+
+    tree = ast.parse(code)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        batch, assigned, read = [], set(), set()
+        for stmt in tree.body:
+            dependencies = find_call_dependencies(stmt, function_names)
+            if dependencies is not None:
+                targets, reads = dependencies
+                if not (reads & assigned or targets & (assigned | read)):
+                    batch.append(stmt)
+                    assigned |= targets
+                    read |= reads
+                    continue
+            if batch:
+                run_batch(batch)
+            if dependencies is not None:
+                batch, assigned, read = [stmt], *dependencies
+            else:
+                batch, assigned, read = [], set(), set()
+                run_statements([stmt])
+        if batch:
+            run_batch(batch)
+    finally:
+        executor.shutdown(wait=True)
+        env.pop("__agento_capture__", None)
+        env.pop("__agento_result__", None)
 
 def execute_python_code(
         code: str, 
         functions: List[Callable] = [],
         context_variables: Dict[str, Any] = {},
-        safe: bool = False
+        safe: bool = False,
+        parallel: bool = False
     ) -> Dict[str, Any]:
     """
     Execute Python code with given functions and context variables,
@@ -17,6 +191,8 @@ def execute_python_code(
         functions (List[Callable], optional): A list of functions to make available to the code.
         context_variables (Dict[str, Any], optional): Variables to make available to the code.
         safe (bool, optional): Whether to sandbox the execution environment by restricting dangerous builtins.
+        parallel (bool, optional): Whether to run independent consecutive function calls concurrently, see execute_parallel().
+            Calls to transfer_to_agent always run sequentially.
     
     Returns:
         Dict[str, Any]: A dictionary containing the function results, variables defined in the code, and any errors.
@@ -43,12 +219,14 @@ def execute_python_code(
     
     # A dictionary to store function call results
     call_results = {}
+    call_results_lock = threading.Lock()
     
     # Wrap the functions to capture their return values
     def make_wrapper(func_name, func):
         def wrapper(*args, **kwargs):
             result = func(*args, **kwargs)
-            call_results.setdefault(func_name, []).append(result)
+            with call_results_lock:
+                call_results.setdefault(func_name, []).append(result)
             return result
         return wrapper
     
@@ -59,7 +237,11 @@ def execute_python_code(
     # Execute the code and catch any exceptions
     errors = []
     try:
-        exec(code, env)
+        if parallel:
+            # Sub-agent transcripts and profiling scopes are recorded in call order on the calling thread
+            execute_parallel(code, env, {func.__name__ for func in functions if func.__name__ != "transfer_to_agent"})
+        else:
+            exec(code, env)
     except Exception as e:
         errors.append(str(e))
     
@@ -84,38 +266,45 @@ def execute_python_code(
         'errors': errors
     }
 
-def process_results(results: Dict[str, Any]) -> Tuple[Dict[str, Any], List[ChatMessage]]:
+def is_chat_messages(obj: Any) -> bool:
+    """
+    Check if the object is a chat message, a list or tuple of chat messages 
+    or a tuple of (str, list[ChatMessage]). Only the first and last items 
+    are looked at, so the check does not depend on the size of the object.
+
+    Args:
+        obj (Any): The object to check.
+
+    Returns:
+        bool: True if the object holds chat messages, False otherwise.
+    """
+    def starts_with_chat_message(items: Any) -> bool:
+        return isinstance(items, (list, tuple)) and len(items) > 0 and isinstance(items[0], ChatMessage)
+
+    return (
+        isinstance(obj, ChatMessage) or 
+        starts_with_chat_message(obj) or 
+        (isinstance(obj, tuple) and len(obj) > 0 and starts_with_chat_message(obj[-1]))
+    )
+
+def process_results(
+        results: Dict[str, Any], 
+        transcripts: TranscriptCollector = None,
+        store: ObjectStore = None
+    ) -> Tuple[Dict[str, Any], List[ChatMessage]]:
     """
-    Process the results of a function call session to remove the history from the results
-    and remove any list of ChatMessages from the variables.
+    Process the results of a function call session to collect the sub-agent
+    transcripts, remove the transferred histories and any other chat messages 
+    from the variables and replace the stored context variables with their handles.
 
     Args:
         results (Dict[str, Any]): The results of a function call session.
+        transcripts (TranscriptCollector, optional): The collector the transfer function reported to.
+        store (ObjectStore, optional): The store of the large context variables of the session.
     
     Returns:
         Tuple[Dict[str, Any], List[ChatMessage]]: The processed results and the chat messages.
     """
-    def is_list_of_chat_messages(obj: Any) -> bool:
-        """
-        Check if the object is a list of ChatMessages or is a tuple of (str, list[ChatMessage]).
-
-        Args:
-            obj (Any): The object to check.
-        
-        Returns:
-            bool: True if the object is a list of ChatMessages or a tuple of (str, list[ChatMessage]), False otherwise.
-        """
-        return (
-            isinstance(obj, list) and
-            all(isinstance(item, ChatMessage) for item in obj)
-        ) or (
-            isinstance(obj, tuple) and
-            len(obj) == 2 and
-            isinstance(obj[0], str) and
-            isinstance(obj[1], list) and
-            all(isinstance(item, ChatMessage) for item in obj[1])
-        )
-    
     if not "function_results" in results or not "variables" in results:
         raise ValueError("Results must contain 'function_results' and 'variables' keys.")
     
@@ -126,16 +315,17 @@ def process_results(results: Dict[str, Any]) -> Tuple[Dict[str, Any], List[ChatM
         else:
             results["function_results"]["transfer_to_agent"] = "Transfer task result"
 
-    # Save the history and chat messages in separate variables
-    chat_messages = []
-    history = results["variables"].get('history', None)
-    chat_messages = [v for _, v in results["variables"].items() if is_list_of_chat_messages(v)]
-    chat_messages = chat_messages + history if history else chat_messages
-    # If chat_messages is a list of one list, extract the list
-    if len(chat_messages) > 0 and isinstance(chat_messages, list) and isinstance(chat_messages[0], list):
-        chat_messages = chat_messages[0]
-    
-    # Remove the history and chat messages from the results
-    results["variables"] = {k: v for k, v in results["variables"].items() if k != 'history' and not is_list_of_chat_messages(v)}
+    # Show the stored context variables as their handles instead of their values
+    if store is not None:
+        for key, value in results["variables"].items():
+            handle = store.handle_of(value)
+            if handle is not None:
+                results["variables"][key] = str(handle)
+
+    # Remove the objects returned by the transfers and the chat messages derived from them from the variables
+    results["variables"] = {
+        k: v for k, v in results["variables"].items()
+        if not (transcripts is not None and transcripts.owns(v)) and not is_chat_messages(v)
+    }
 
-    return results, chat_messages[2:] # Skip the first two messages (system prompt and task prompt)
\ No newline at end of file
+    return results, list(transcripts.messages) if transcripts is not None else []
@@ -0,0 +1,159 @@
+from typing import List, Dict, Any, Iterator
+from contextlib import contextmanager
+from collections import deque
+import threading
+import tracemalloc
+
+class MemoryProfiler:
+    """
+    Opt-in memory profiler built on tracemalloc. Agent turns and code
+    executions are tracked as nested scopes, and the bytes each scope
+    retained and peaked at are attributed to its session and agent.
+
+    Since tracemalloc traces the whole process, concurrent scopes in
+    different threads see each other's allocations and the attribution
+    is approximate.
+    """
+    def __init__(self, threshold: int = None, max_executions: int = 100):
+        """
+        Args:
+            threshold (int, optional): The retained bytes above which a session is flagged.
+            max_executions (int): The number of most recent code executions to keep records of.
+        """
+        self.threshold = threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._executions = deque(maxlen=max_executions)
+        self._started = False
+
+    def start(self) -> None:
+        """Start tracing allocations, if not already traced."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+
+    def stop(self) -> None:
+        """Stop tracing allocations, if the tracing was started by the profiler."""
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def _stack(self) -> List[Dict[str, Any]]:
+        """Get the stack of open scopes of the current thread."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def track(self, agent: str = None, session: str = None, execution: bool = False) -> Iterator[None]:
+        """
+        Track the memory allocated in the scope. Missing session and agent
+        names are taken from the enclosing scope.
+
+        Args:
+            agent (str, optional): The name of the agent the scope belongs to.
+            session (str, optional): The id of the session the scope belongs to, 'default' if there is no enclosing scope.
+            execution (bool): Whether the scope is a code execution rather than an agent turn.
+        """
+        self.start()
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        scope = {
+            "session": session or (parent["session"] if parent else "default"),
+            "agent": agent or (parent["agent"] if parent else "unknown"),
+        }
+
+        # Hand the peak so far to the parent before measuring the scope's own peak
+        current, peak = tracemalloc.get_traced_memory()
+        if parent:
+            parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+        scope["start"] = scope["peak"] = current
+        stack.append(scope)
+        try:
+            yield
+        finally:
+            stack.pop()
+            current, peak = tracemalloc.get_traced_memory()
+            scope["peak"] = max(scope["peak"], peak)
+            if parent:
+                parent["peak"] = max(parent["peak"], scope["peak"])
+            self._record(
+                scope["session"],
+                scope["agent"],
+                retained=current - scope["start"],
+                peak=scope["peak"] - scope["start"],
+                execution=execution,
+                # Only the outermost scope of a session counts towards the session
+                outermost=parent is None or parent["session"] != scope["session"]
+            )
+
+    def _record(self, session: str, agent: str, retained: int, peak: int, execution: bool, outermost: bool) -> None:
+        """Attribute the bytes of a closed scope to its session and agent."""
+        with self._lock:
+            session_stats = self._sessions.setdefault(
+                session, {"current": 0, "peak": 0, "flagged": False, "agents": {}}
+            )
+            agent_stats = session_stats["agents"].setdefault(
+                agent, {"current": 0, "peak": 0, "turns": 0, "executions": 0}
+            )
+
+            if execution:
+                agent_stats["executions"] += 1
+                self._executions.append({"session": session, "agent": agent, "retained": retained, "peak": peak})
+                return
+
+            agent_stats["peak"] = max(agent_stats["peak"], agent_stats["current"] + peak)
+            agent_stats["current"] += retained
+            agent_stats["turns"] += 1
+
+            if outermost:
+                session_stats["peak"] = max(session_stats["peak"], session_stats["current"] + peak)
+                session_stats["current"] += retained
+                if self.threshold is not None and session_stats["current"] > self.threshold:
+                    session_stats["flagged"] = True
+
+    def flagged_sessions(self) -> List[str]:
+        """
+        Get the sessions whose retained bytes exceeded the threshold.
+
+        Returns:
+            List[str]: The ids of the flagged sessions.
+        """
+        with self._lock:
+            return [session for session, stats in self._sessions.items() if stats["flagged"]]
+
+    def forget(self, session: str) -> None:
+        """
+        Drop the statistics of a finished session.
+
+        Args:
+            session (str): The id of the session.
+        """
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the memory statistics. Bytes are reported as current (retained
+        after the scopes closed) and peak, per session and per agent within
+        a session, along with the most recent code executions and the
+        totals traced by tracemalloc.
+
+        Returns:
+            Dict[str, Any]: The memory statistics.
+        """
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            return {
+                "sessions": {
+                    session: {
+                        **{k: v for k, v in stats.items() if k != "agents"},
+                        "agents": {agent: dict(agent_stats) for agent, agent_stats in stats["agents"].items()},
+                    }
+                    for session, stats in self._sessions.items()
+                },
+                "executions": list(self._executions),
+                "traced": {"current": current, "peak": peak},
+            }
@@ -0,0 +1,123 @@
+from typing import List, Dict, Tuple, Optional, Iterable, Pattern
+from collections import OrderedDict
+import threading
+import re
+
+from agento.utils import format_agent_name
+
+def normalize_task(task: str) -> str:
+    """
+    Normalize a task into a routing cache key. The key is lower case,
+    without punctuation, with numbers replaced by '#' and whitespace
+    collapsed, so tasks that only differ in quantities share a key.
+
+    Args:
+        task (str): The task to normalize.
+
+    Returns:
+        str: The normalized task key.
+    """
+    task = re.sub(r"\d+(\.\d+)?", "#", task.lower())
+    task = re.sub(r"[^\w#\s]", " ", task)
+    return " ".join(task.split())
+
+class Router:
+    """
+    Router in front of an orchestrator agent. Tasks matching a rule
+    or a cached past decision are dispatched straight to the sub-agent,
+    skipping the orchestrator's round trip. Only turns in which the
+    orchestrator transferred the task to a single agent without errors
+    are cached.
+
+    A dispatched sub-agent gets the raw user task and the orchestrator's
+    whole context variables, not the rephrased task and the selected
+    context the orchestrator would have passed to transfer_to_agent.
+    """
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._rules: List[Tuple[Pattern, str]] = []
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"rule_hits": 0, "cache_hits": 0, "misses": 0}
+
+    def add_rule(self, agent_name: str, keywords: List[str] = [], pattern: str = None) -> "Router":
+        """
+        Add a rule routing the tasks that contain any of the keywords
+        or match the regex pattern to the given agent. Rules are checked
+        in the order they were added, before the cache.
+
+        Args:
+            agent_name (str): The name of the agent to route to.
+            keywords (List[str]): The keywords to match as whole words, case insensitive.
+            pattern (str, optional): The regex pattern to search for, case insensitive.
+
+        Returns:
+            Router: The router, for chaining.
+        """
+        if not keywords and not pattern:
+            raise ValueError("A rule needs keywords or a pattern.")
+
+        agent_name = format_agent_name(agent_name)
+        if keywords:
+            keyword_pattern = r"\b(" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b"
+            self._rules.append((re.compile(keyword_pattern, re.IGNORECASE), agent_name))
+        if pattern:
+            self._rules.append((re.compile(pattern, re.IGNORECASE), agent_name))
+        return self
+
+    def route(self, task: str, agent_names: Iterable[str]) -> Optional[str]:
+        """
+        Get the agent to dispatch the task to, if a rule or the cache knows it.
+
+        Args:
+            task (str): The task to route.
+            agent_names (Iterable[str]): The names of the agents available for dispatching.
+
+        Returns:
+            Optional[str]: The name of the agent, or None if the orchestrator has to decide.
+        """
+        agent_names = set(agent_names)
+        with self._lock:
+            for rule, agent_name in self._rules:
+                if agent_name in agent_names and rule.search(task):
+                    self._stats["rule_hits"] += 1
+                    return agent_name
+
+            key = normalize_task(task)
+            agent_name = self._cache.get(key)
+            if agent_name in agent_names:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                return agent_name
+
+            self._stats["misses"] += 1
+            return None
+
+    def learn(self, task: str, agent_name: str) -> None:
+        """
+        Cache the orchestrator's decision to transfer the task to the agent.
+
+        Args:
+            task (str): The task the orchestrator received.
+            agent_name (str): The name of the agent the task was transferred to.
+        """
+        with self._lock:
+            key = normalize_task(task)
+            self._cache[key] = format_agent_name(agent_name)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the hit and miss statistics of the router.
+
+        Returns:
+            Dict[str, int]: The rule hits, cache hits, total hits, misses and cache size.
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "hits": self._stats["rule_hits"] + self._stats["cache_hits"],
+                "cache_size": len(self._cache),
+            }
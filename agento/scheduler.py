@@ -0,0 +1,263 @@
+from typing import Dict, Optional
+from enum import IntEnum
+import threading
+import itertools
+import heapq
+import time
+
+from agento.settings import PROVIDER_URLS, PROVIDER_RATE_LIMITS
+
+class Priority(IntEnum):
+    """Priority classes for completion requests, lower values are served first."""
+    INTERACTIVE = 0
+    BATCH = 1
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at a fixed rate
+    up to its capacity.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """
+        Refill the bucket for the time elapsed since the last update.
+
+        Args:
+            now (float): The current monotonic time.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """
+        Get the time until the given amount of tokens is available.
+
+        Args:
+            amount (float): The amount of tokens, clamped to the capacity of the bucket.
+
+        Returns:
+            float: The time to wait in seconds, 0 if the tokens are available.
+        """
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """
+        Consume tokens from the bucket. The balance may go negative
+        when a request used more tokens than estimated.
+
+        Args:
+            amount (float): The amount of tokens to consume.
+        """
+        self.tokens -= amount
+
+class ProviderScheduler:
+    """
+    Scheduler for the completion requests sent to a single provider.
+    Requests wait in a priority queue until the request and token
+    buckets of the provider allow them to be sent.
+    """
+    def __init__(
+            self,
+            requests_per_second: Optional[float] = None,
+            tokens_per_minute: Optional[float] = None
+        ):
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self._condition = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._metrics = {
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "requests": {priority.name.lower(): 0 for priority in Priority},
+            "total_wait_time": {priority.name.lower(): 0.0 for priority in Priority},
+            "max_wait_time": {priority.name.lower(): 0.0 for priority in Priority},
+        }
+
+    def _time_until_ready(self, tokens: int) -> float:
+        """Get the time until both buckets allow a request with the given tokens."""
+        now = time.monotonic()
+        wait = 0.0
+        if self.requests:
+            self.requests.refill(now)
+            wait = max(wait, self.requests.time_until(1))
+        if self.tokens:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.time_until(tokens))
+        return wait
+
+    def acquire(
+            self, 
+            priority: Priority = Priority.INTERACTIVE, 
+            tokens: int = 0, 
+            cancelled: threading.Event = None
+        ) -> Optional[float]:
+        """
+        Block until a request with the given priority and estimated
+        token count may be sent, or until it is cancelled.
+
+        Args:
+            priority (Priority): The priority class of the request.
+            tokens (int): The estimated token count of the request.
+            cancelled (threading.Event, optional): Set through cancel() when the request is no longer needed.
+
+        Returns:
+            Optional[float]: The time the request waited in the queue in seconds, 
+            or None if it was cancelled, then it is neither charged nor counted.
+        """
+        enqueued_at = time.monotonic()
+        entry = (int(priority), next(self._counter))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            self._metrics["queue_depth"] = len(self._queue)
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], len(self._queue))
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    # Leave the queue and let the next request move up
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._metrics["queue_depth"] = len(self._queue)
+                    self._condition.notify_all()
+                    return None
+                if self._queue[0] == entry:
+                    wait = self._time_until_ready(tokens)
+                    if wait <= 0:
+                        break
+                    self._condition.wait(timeout=wait)
+                else:
+                    self._condition.wait()
+
+            heapq.heappop(self._queue)
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+
+            waited = time.monotonic() - enqueued_at
+            key = Priority(priority).name.lower()
+            self._metrics["queue_depth"] = len(self._queue)
+            self._metrics["requests"][key] += 1
+            self._metrics["total_wait_time"][key] += waited
+            self._metrics["max_wait_time"][key] = max(self._metrics["max_wait_time"][key], waited)
+            self._condition.notify_all()
+        return waited
+
+    def cancel(self, cancelled: threading.Event) -> None:
+        """
+        Cancel the requests waiting with the given event.
+
+        Args:
+            cancelled (threading.Event): The event passed to acquire().
+        """
+        with self._condition:
+            cancelled.set()
+            self._condition.notify_all()
+
+    def release(self, priority: Priority, tokens: int) -> None:
+        """
+        Give back the budget of a request that was acquired but not sent.
+
+        Args:
+            priority (Priority): The priority class passed to acquire().
+            tokens (int): The token count passed to acquire().
+        """
+        with self._condition:
+            if self.requests:
+                self.requests.consume(-1)
+            if self.tokens:
+                self.tokens.consume(-tokens)
+            self._metrics["requests"][Priority(priority).name.lower()] -= 1
+            self._condition.notify_all()
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Correct the token bucket with the token usage reported by the provider.
+
+        Args:
+            estimated_tokens (int): The token count passed to acquire().
+            used_tokens (int): The token count reported by the provider.
+        """
+        if not self.tokens:
+            return
+        with self._condition:
+            self.tokens.consume(used_tokens - estimated_tokens)
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, object]:
+        """
+        Get the queue-depth and wait-time metrics of the scheduler.
+
+        Returns:
+            Dict[str, object]: The metrics, with the wait times in seconds per priority class.
+        """
+        with self._condition:
+            return {
+                "queue_depth": self._metrics["queue_depth"],
+                "max_queue_depth": self._metrics["max_queue_depth"],
+                "requests": dict(self._metrics["requests"]),
+                "total_wait_time": dict(self._metrics["total_wait_time"]),
+                "max_wait_time": dict(self._metrics["max_wait_time"]),
+            }
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    """
+    Get the scheduler of the given provider, creating it from
+    PROVIDER_RATE_LIMITS on first use.
+
+    Args:
+        provider (str): The provider to get the scheduler for.
+
+    Returns:
+        ProviderScheduler: The scheduler of the provider.
+    """
+    if provider not in PROVIDER_URLS:
+        raise ValueError(f"Provider {provider} not supported. Available providers: {', '.join(PROVIDER_URLS.keys())}")
+
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            requests_per_second, tokens_per_minute = PROVIDER_RATE_LIMITS.get(provider, (None, None))
+            _schedulers[provider] = ProviderScheduler(requests_per_second, tokens_per_minute)
+        return _schedulers[provider]
+
+def set_rate_limits(
+        provider: str,
+        requests_per_second: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
+    ) -> ProviderScheduler:
+    """
+    Replace the scheduler of the given provider with one using the given limits.
+
+    Args:
+        provider (str): The provider to set the limits for.
+        requests_per_second (float, optional): The maximum requests per second, None for no limit.
+        tokens_per_minute (float, optional): The maximum tokens per minute, None for no limit.
+
+    Returns:
+        ProviderScheduler: The new scheduler of the provider.
+    """
+    if provider not in PROVIDER_URLS:
+        raise ValueError(f"Provider {provider} not supported. Available providers: {', '.join(PROVIDER_URLS.keys())}")
+
+    with _schedulers_lock:
+        _schedulers[provider] = ProviderScheduler(requests_per_second, tokens_per_minute)
+        return _schedulers[provider]
+
+def scheduler_metrics() -> Dict[str, Dict[str, object]]:
+    """
+    Get the metrics of all the provider schedulers in use.
+
+    Returns:
+        Dict[str, Dict[str, object]]: The metrics per provider.
+    """
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {provider: scheduler.metrics() for provider, scheduler in schedulers.items()}
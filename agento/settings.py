@@ -19,6 +19,25 @@ PROVIDER_URLS = {
     "openrouter": (OPENROUTER_URL, OPENROUTER_API_KEY),
 }
 
+# Rate limits per provider as (requests per second, tokens per minute), None for no limit
+PROVIDER_RATE_LIMITS = {
+    "lm_studio": (None, None),
+    "ollama": (None, None),
+    "vllm": (None, None),
+    "openrouter": (None, None),
+}
+
+# Providers that can return several completions for one request through the `n` parameter
+PROVIDERS_SUPPORTING_N = ["vllm"]
+
 # Define the settings
 SYSTEM_PROMPT_PATH = "agento/system_prompt.txt"
+SCHEMA_ENCODING = "json" # Encoding of the functions schema in the system prompt: json, compact or stub
+SCHEMA_SUMMARY_ONLY = False # Whether to only keep the summary of the docstrings in the functions schema
+WORKER_HEARTBEAT_INTERVAL = 1.0 # Seconds between the heartbeats of a worker
+WORKER_HEARTBEAT_TIMEOUT = 5.0 # Seconds without a heartbeat after which a worker is declared dead
+WORKER_SESSION_TIMEOUT = 600.0 # Seconds without a job after which a session no longer sticks to its worker
+WORKER_CONNECTION_TIMEOUT = 10.0 # Seconds to wait for the server of a socket queue to connect and answer
+CONTEXT_HANDLE_MAX_ITEMS = 20 # Context variables with more items are shown to the model as handles
+CONTEXT_HANDLE_MAX_CHARS = 1000 # Context strings with more characters are shown to the model as handles
 DEBUG = False # Whether to print debug information
\ No newline at end of file
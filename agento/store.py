@@ -0,0 +1,150 @@
+from typing import Dict, Any, Optional
+from pydantic import BaseModel
+from itertools import islice
+import threading
+
+from agento.settings import CONTEXT_HANDLE_MAX_ITEMS, CONTEXT_HANDLE_MAX_CHARS
+
+class ContextHandle(BaseModel):
+    """Typed reference to a large context variable, shown to the model instead of its value."""
+    key: str
+    type_name: str
+    length: Optional[int] = None
+    preview: str = ""
+
+    def __str__(self) -> str:
+        length = f" len={self.length}" if self.length is not None else ""
+        return f"<handle:{self.key} {self.type_name}{length} preview={self.preview}>"
+
+def create_preview(value: Any, max_items: int = 3, max_chars: int = 40, max_depth: int = 2) -> str:
+    """
+    Create a short preview of the value from its first items,
+    without rendering the whole value.
+
+    Args:
+        value (Any): The value to preview.
+        max_items (int): The number of items to show for containers.
+        max_chars (int): The number of characters to show for strings and other values.
+        max_depth (int): The number of nested container levels to show the items of.
+
+    Returns:
+        str: The preview.
+    """
+    def shorten(text: str) -> str:
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+    def preview(item: Any) -> str:
+        return create_preview(item, max_items, max_chars, max_depth - 1)
+
+    if isinstance(value, (str, bytes)):
+        return shorten(repr(value[:max_chars + 1]))
+    if isinstance(value, (set, frozenset)) and not value:
+        return repr(value)
+    if isinstance(value, (dict, list, tuple, set, frozenset)):
+        opening, closing = {dict: "{}", list: "[]", tuple: "()"}.get(type(value), "{}")
+        if max_depth <= 0:
+            return opening + ("..." if value else "") + closing
+        if isinstance(value, dict):
+            items = [f"{preview(k)}: {preview(v)}" for k, v in islice(value.items(), max_items)]
+        else:
+            items = [preview(item) for item in islice(value, max_items)]
+        more = ", ..." if len(value) > max_items else ("," if isinstance(value, tuple) and len(value) == 1 else "")
+        return opening + ", ".join(items) + more + closing
+    return shorten(repr(value))
+
+class ObjectStore:
+    """
+    Per-session store of the large context variables. The model only
+    sees a handle with a short preview of each stored value, while the
+    code executed for the session gets the live object.
+    """
+    def __init__(self, max_items: int = CONTEXT_HANDLE_MAX_ITEMS, max_chars: int = CONTEXT_HANDLE_MAX_CHARS):
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self._objects: Dict[str, Any] = {}
+        self._handles: Dict[int, ContextHandle] = {}
+        self._lock = threading.Lock()
+
+    def is_large(self, value: Any) -> bool:
+        """
+        Check if the value is too large to render into the prompt.
+
+        Args:
+            value (Any): The value to check.
+
+        Returns:
+            bool: True if the value is a string longer than max_chars or a container with more than max_items items.
+        """
+        if isinstance(value, (str, bytes)):
+            return len(value) > self.max_chars
+        if isinstance(value, (list, tuple, set, frozenset, dict)):
+            return len(value) > self.max_items
+        return False
+
+    def put(self, key: str, value: Any) -> ContextHandle:
+        """
+        Store the value under the key, replacing the previous value of the key.
+
+        Args:
+            key (str): The name of the context variable.
+            value (Any): The value, stored without copying.
+
+        Returns:
+            ContextHandle: The handle of the value.
+        """
+        handle = ContextHandle(
+            key=key,
+            type_name=type(value).__name__,
+            length=len(value) if hasattr(value, "__len__") else None,
+            preview=create_preview(value)
+        )
+        with self._lock:
+            previous = self._objects.get(key)
+            if previous is not None:
+                self._handles.pop(id(previous), None)
+            self._objects[key] = value
+            self._handles[id(value)] = handle
+        return handle
+
+    def get(self, key: str) -> Any:
+        """
+        Get the live object stored under the key.
+
+        Args:
+            key (str): The name of the context variable.
+
+        Returns:
+            Any: The stored object.
+        """
+        with self._lock:
+            return self._objects[key]
+
+    def handle_of(self, value: Any) -> Optional[ContextHandle]:
+        """
+        Get the handle of the value if it is a stored object.
+
+        Args:
+            value (Any): The value to look up, by identity.
+
+        Returns:
+            Optional[ContextHandle]: The handle, or None if the value is not stored.
+        """
+        with self._lock:
+            handle = self._handles.get(id(value))
+            return handle if handle is not None and self._objects.get(handle.key) is value else None
+
+    def render(self, context_variables: Dict[str, Any]) -> str:
+        """
+        Render the context variables for the prompt, storing the large
+        values and showing their handles instead.
+
+        Args:
+            context_variables (Dict[str, Any]): The context variables.
+
+        Returns:
+            str: The rendered context variables, like str() of the dictionary for small values.
+        """
+        rendered = []
+        for key, value in context_variables.items():
+            rendered.append(f"{key!r}: {self.put(key, value) if self.is_large(value) else repr(value)}")
+        return "{" + ", ".join(rendered) + "}"
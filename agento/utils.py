@@ -1,6 +1,8 @@
 import re
-from typing import List, Callable, Any, Tuple
+from typing import List, Callable, Any, Tuple, Dict
+import textwrap
 import inspect
+import weakref
 import json
 
 from rich.console import Console
@@ -9,7 +11,14 @@ from rich.text import Text
 from rich.table import Table
 
 from agento.settings import SYSTEM_PROMPT_PATH
-from agento.client import ChatMessage
+from agento.client import ChatMessage, estimate_tokens
+from agento.store import ObjectStore
+
+# Available encodings of the functions schema
+SCHEMA_ENCODINGS = ("json", "compact", "stub")
+
+# Cache of the encoded schemas, released with the functions
+_function_schema_cache = weakref.WeakKeyDictionary()
 
 def extract_python_code(content: str) -> Tuple[str, bool]:
     """
@@ -29,43 +38,147 @@ def extract_python_code(content: str) -> Tuple[str, bool]:
     else:
         return '', False
 
-def create_functions_schema(functions: List[Callable]) -> str:
+def get_docstring(function: Callable, summary_only: bool = False) -> str:
+    """
+    Get the docstring of the function for the prompt.
+
+    Args:
+        function (Callable): The function to get the docstring of.
+        summary_only (bool): Whether to only keep the summary, the first paragraph of the docstring.
+
+    Returns:
+        str: The docstring, empty if the function has none.
+    """
+    if not function.__doc__:
+        return ""
+    if not summary_only:
+        return function.__doc__.replace('\\n', '\n')
+    return " ".join(inspect.cleandoc(function.__doc__).split("\n\n")[0].split())
+
+def create_function_metadata(function: Callable, summary_only: bool = False) -> dict:
+    """
+    Creates the schema metadata of a single function.
+
+    Args:
+        function (Callable): The function to create the metadata of.
+        summary_only (bool): Whether to only keep the summary of the docstring.
+
+    Returns:
+        dict: The name, description, parameters and return type of the function.
+    """
+    annotations = function.__annotations__
+    parameters = {
+        param: annotations.get(param, Any).__name__
+        for param in inspect.signature(function).parameters
+        if param != 'return'
+    }
+    returns = annotations.get('return', Any).__name__
+
+    return {
+        "name": function.__name__,
+        "description": get_docstring(function, summary_only),
+        "parameters": {"properties": parameters, "required": list(parameters.keys())},
+        "returns": returns
+    }
+
+def encode_function_schema(function: Callable, encoding: str = "json", summary_only: bool = False) -> str:
+    """
+    Encodes the schema of a single function. The encoded schemas are 
+    cached per function, encoding and docstring mode.
+
+    Args:
+        function (Callable): The function to encode the schema of.
+        encoding (str): The encoding, one of SCHEMA_ENCODINGS.
+        summary_only (bool): Whether to only keep the summary of the docstring.
+
+    Returns:
+        str: The encoded schema of the function.
+    """
+    cache = _function_schema_cache.setdefault(function, {})
+    key = (encoding, summary_only, function.__doc__)
+    if key in cache:
+        return cache[key]
+
+    metadata = create_function_metadata(function, summary_only)
+    if encoding == "json":
+        encoded = textwrap.indent(json.dumps(metadata, indent=2, ensure_ascii=False), "  ")
+    elif encoding == "compact":
+        encoded = json.dumps(metadata, separators=(",", ":"), ensure_ascii=False)
+    elif encoding == "stub":
+        parameters = ", ".join(f"{param}: {type_name}" for param, type_name in metadata["parameters"]["properties"].items())
+        description = metadata["description"]
+        encoded = f"def {metadata['name']}({parameters}) -> {metadata['returns']}:"
+        if not description:
+            encoded += "\n    ..."
+        elif summary_only:
+            encoded += f'\n    """{description}"""'
+        else:
+            encoded += '\n    """\n' + textwrap.indent(inspect.cleandoc(description), "    ") + '\n    """'
+    else:
+        raise ValueError(f"Schema encoding {encoding} not supported. Available encodings: {', '.join(SCHEMA_ENCODINGS)}")
+
+    cache[key] = encoded
+    return encoded
+
+def create_functions_schema(functions: List[Callable], encoding: str = "json", summary_only: bool = False) -> str:
     """
     Creates the functions schema for the prompt.
+
+    Args:
+        functions (List[Callable]): The functions to create the schema of.
+        encoding (str): The encoding, one of SCHEMA_ENCODINGS. 'json' is indented JSON, 
+        'compact' is JSON without whitespace and 'stub' is Python stub signatures.
+        summary_only (bool): Whether to only keep the summary of the docstrings.
+
+    Returns:
+        str: The functions schema.
     """
-    functions_schema = []
+    if encoding not in SCHEMA_ENCODINGS:
+        raise ValueError(f"Schema encoding {encoding} not supported. Available encodings: {', '.join(SCHEMA_ENCODINGS)}")
+
+    encoded_functions = []
     for function in functions:
-        name = function.__name__
         try:
-            annotations = function.__annotations__
-            parameters = {
-                param: annotations.get(param, Any).__name__
-                for param in inspect.signature(function).parameters
-                if param != 'return'
-            }
-            returns = annotations.get('return', Any).__name__
-            
-            metadata = {
-                "name": name,
-                "description": function.__doc__.replace('\\n', '\n') if function.__doc__ else "",
-                "parameters": {"properties": parameters, "required": list(parameters.keys())},
-                "returns": returns
-            }
-            functions_schema.append(metadata)
+            encoded_functions.append(encode_function_schema(function, encoding, summary_only))
         except Exception as e:
-            print(f"Error creating metadata for function {name}: {str(e)}")
+            print(f"Error creating metadata for function {function.__name__}: {str(e)}")
+
+    if encoding == "stub":
+        return "\n\n".join(encoded_functions)
+    if encoding == "compact":
+        return "[" + ",".join(encoded_functions) + "]"
+    return "[\n" + ",\n".join(encoded_functions) + "\n]" if encoded_functions else "[]"
+
+def schema_token_counts(functions: List[Callable]) -> Dict[str, Dict[str, int]]:
+    """
+    Reports the estimated token count of the functions schema in every 
+    encoding, with full and summary-only docstrings.
+
+    Args:
+        functions (List[Callable]): The functions to create the schema of.
 
-    return json.dumps(functions_schema, indent=2, ensure_ascii=False)
+    Returns:
+        Dict[str, Dict[str, int]]: The token counts per encoding, as {'full': ..., 'summary': ...}.
+    """
+    return {
+        encoding: {
+            "full": estimate_tokens(create_functions_schema(functions, encoding)),
+            "summary": estimate_tokens(create_functions_schema(functions, encoding, summary_only=True)),
+        }
+        for encoding in SCHEMA_ENCODINGS
+    }
 
 def load_system_prompt(
         functions_schema: str = "",
         instructions: str = "",
         context_variables = None,
         is_orchestrator: bool = False,
-        file_path: str = SYSTEM_PROMPT_PATH
+        file_path: str = SYSTEM_PROMPT_PATH,
+        store: ObjectStore = None
     ) -> str:
     """
-    Loads the system prompt from the specified file.
+    Loads the system prompt from the specified file. If a store is given,
+    the large context variables are stored in it and rendered as handles.
     """
     def replace_functions_schema(content: str) -> str:
         return content.replace("{{functions_schema}}", functions_schema)
@@ -74,7 +187,11 @@ def load_system_prompt(
         return content.replace("{{instructions}}", instructions)
     
     def replace_context_variables(content: str) -> str:
-        return content.replace("{{context_variables}}", str(context_variables) if not isinstance(context_variables, str) else context_variables)
+        if isinstance(context_variables, str):
+            return content.replace("{{context_variables}}", context_variables)
+        if store is not None and isinstance(context_variables, dict):
+            return content.replace("{{context_variables}}", store.render(context_variables))
+        return content.replace("{{context_variables}}", str(context_variables))
     
     def replace_prompt_beginning(content: str) -> str:
         if is_orchestrator:
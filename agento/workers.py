@@ -0,0 +1,601 @@
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Connection, answer_challenge, deliver_challenge
+from collections import deque, OrderedDict
+from pydantic import BaseModel, Field
+import threading
+import secrets
+import socket
+import time
+import uuid
+
+from agento.settings import (
+    WORKER_HEARTBEAT_INTERVAL,
+    WORKER_HEARTBEAT_TIMEOUT,
+    WORKER_SESSION_TIMEOUT,
+    WORKER_CONNECTION_TIMEOUT
+)
+from agento.client import ChatMessage
+from agento.utils import format_agent_name
+
+# Type alias for the process function of an agent
+AgentFunction = Callable[..., List[ChatMessage]]
+
+class Job(BaseModel):
+    """A task for an agent, to be run by a worker."""
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    agent_name: str
+    task: str = ""
+    history: List[ChatMessage] = []
+    context_variables: Optional[Dict[str, Any]] = None
+    session_id: Optional[str] = None
+
+class JobResult(BaseModel):
+    """The outcome of a job, either the agent's history or an error."""
+    job_id: str
+    worker_id: str
+    history: Optional[List[ChatMessage]] = None
+    error: Optional[str] = None
+
+class WorkQueue(ABC):
+    """
+    Interface of the work queue between the agents submitting jobs
+    and the workers running them. Implemented in-process by LocalQueue
+    and across nodes by SocketQueue.
+    """
+    @abstractmethod
+    def submit(self, job: Job) -> Future:
+        """
+        Submit a job.
+
+        Args:
+            job (Job): The job to run.
+
+        Returns:
+            Future: A future resolving to the history of the agent after running the job.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def register(self, worker_id: str, agent_names: List[str]) -> None:
+        """
+        Register a worker and the agents it can run.
+
+        Args:
+            worker_id (str): The id of the worker.
+            agent_names (List[str]): The names of the agents the worker can run.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, worker_id: str) -> bool:
+        """
+        Report that a worker is alive.
+
+        Args:
+            worker_id (str): The id of the worker.
+
+        Returns:
+            bool: False if the worker is unknown, e.g. it was declared dead, and has to register again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_job(self, worker_id: str, timeout: float = 1.0) -> Optional[Job]:
+        """
+        Get the next job a worker can run, respecting session affinity.
+
+        Args:
+            worker_id (str): The id of the worker.
+            timeout (float): The time to wait for a job, in seconds.
+
+        Returns:
+            Optional[Job]: The job, or None if no job arrived in time.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, result: JobResult) -> None:
+        """
+        Report the outcome of a job.
+
+        Args:
+            result (JobResult): The outcome of the job.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def forget_session(self, session_id: str) -> None:
+        """
+        Tell the workers to release what their agents keep for a finished session.
+
+        Args:
+            session_id (str): The id of the session.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def forgotten_sessions(self, worker_id: str) -> List[str]:
+        """
+        Get the sessions forgotten since the worker last asked.
+
+        Args:
+            worker_id (str): The id of the worker.
+
+        Returns:
+            List[str]: The ids of the forgotten sessions.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def status(self) -> Dict[str, Any]:
+        """
+        Get the status of the queue.
+
+        Returns:
+            Dict[str, Any]: The live workers, the pending and running job counts and the session assignments.
+        """
+        raise NotImplementedError
+
+class LocalQueue(WorkQueue):
+    """
+    In-process work queue. Jobs of a session stick to the worker that
+    ran the session first, for as long as that worker sends heartbeats
+    and the session gets jobs within the session timeout. Jobs of workers 
+    that missed their heartbeats are queued again.
+    """
+    def __init__(
+            self, 
+            heartbeat_timeout: float = WORKER_HEARTBEAT_TIMEOUT, 
+            session_timeout: float = WORKER_SESSION_TIMEOUT
+        ):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.session_timeout = session_timeout
+        self._condition = threading.Condition()
+        self._pending: deque = deque()
+        self._running: Dict[str, Tuple[str, Job]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._workers: Dict[str, Dict[str, Any]] = {}
+        # Session assignments and the time they were last used, least recently used first
+        self._sessions: OrderedDict[str, str] = OrderedDict()
+        self._session_last_used: Dict[str, float] = {}
+
+    def _use_session(self, session_id: str, worker_id: str) -> None:
+        """Assign the session to the worker and mark it as most recently used."""
+        self._sessions[session_id] = worker_id
+        self._sessions.move_to_end(session_id)
+        self._session_last_used[session_id] = time.monotonic()
+
+    def _reap(self) -> None:
+        """
+        Drop the workers that missed their heartbeats and queue their jobs again,
+        and drop the session assignments that were not used within the session timeout.
+        """
+        now = time.monotonic()
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if now - self._session_last_used[session_id] <= self.session_timeout:
+                break
+            del self._sessions[session_id], self._session_last_used[session_id]
+
+        dead = [worker_id for worker_id, worker in self._workers.items() if now - worker["last_seen"] > self.heartbeat_timeout]
+        for worker_id in dead:
+            del self._workers[worker_id]
+            for job_id, (owner, job) in list(self._running.items()):
+                if owner == worker_id:
+                    del self._running[job_id]
+                    self._pending.appendleft(job)
+            for session_id in [session_id for session_id, owner in self._sessions.items() if owner == worker_id]:
+                del self._sessions[session_id], self._session_last_used[session_id]
+        if dead:
+            self._condition.notify_all()
+
+    def submit(self, job: Job) -> Future:
+        future = Future()
+        with self._condition:
+            self._futures[job.id] = future
+            self._pending.append(job)
+            self._condition.notify_all()
+        return future
+
+    def register(self, worker_id: str, agent_names: List[str]) -> None:
+        with self._condition:
+            self._workers[worker_id] = {
+                "last_seen": time.monotonic(),
+                "agents": {format_agent_name(agent_name) for agent_name in agent_names},
+                "forgotten": [],
+            }
+            self._condition.notify_all()
+
+    def heartbeat(self, worker_id: str) -> bool:
+        with self._condition:
+            self._reap()
+            if worker_id not in self._workers:
+                return False
+            self._workers[worker_id]["last_seen"] = time.monotonic()
+            return True
+
+    def _take(self, worker_id: str) -> Optional[Job]:
+        """Take the first pending job the worker can run."""
+        agents = self._workers[worker_id]["agents"]
+        for job in self._pending:
+            if format_agent_name(job.agent_name) not in agents:
+                continue
+            owner = self._sessions.get(job.session_id) if job.session_id else None
+            if owner is not None and owner != worker_id:
+                continue
+            self._pending.remove(job)
+            self._running[job.id] = (worker_id, job)
+            if job.session_id:
+                self._use_session(job.session_id, worker_id)
+            return job
+        return None
+
+    def get_job(self, worker_id: str, timeout: float = 1.0) -> Optional[Job]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._reap()
+                # Workers declared dead get no jobs until they register again
+                job = self._take(worker_id) if worker_id in self._workers else None
+                remaining = deadline - time.monotonic()
+                if job is not None or remaining <= 0:
+                    return job
+                self._condition.wait(timeout=min(remaining, self.heartbeat_timeout))
+
+    def complete(self, result: JobResult) -> None:
+        with self._condition:
+            running = self._running.get(result.job_id)
+            # Ignore the outcome of a job that was queued again after its worker was declared dead
+            if running is None or running[0] != result.worker_id:
+                return
+            del self._running[result.job_id]
+            future = self._futures.pop(result.job_id)
+            if running[1].session_id and self._sessions.get(running[1].session_id) == result.worker_id:
+                self._use_session(running[1].session_id, result.worker_id)
+        if result.error is not None:
+            future.set_exception(RuntimeError(f"Job {result.job_id} failed on worker {result.worker_id}: {result.error}"))
+        else:
+            future.set_result(result.history)
+
+    def forget_session(self, session_id: str) -> None:
+        with self._condition:
+            if session_id in self._sessions:
+                del self._sessions[session_id], self._session_last_used[session_id]
+            for worker in self._workers.values():
+                worker["forgotten"].append(session_id)
+
+    def forgotten_sessions(self, worker_id: str) -> List[str]:
+        with self._condition:
+            worker = self._workers.get(worker_id)
+            if worker is None:
+                return []
+            forgotten, worker["forgotten"] = worker["forgotten"], []
+            return forgotten
+
+    def status(self) -> Dict[str, Any]:
+        with self._condition:
+            self._reap()
+            return {
+                "workers": sorted(self._workers),
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "sessions": dict(self._sessions),
+            }
+
+class SocketQueueServer:
+    """
+    Serves a LocalQueue over a socket, so that workers and agents
+    on other nodes can use it through a SocketQueue. Connections are
+    authenticated with the authkey, since the messages are unpickled;
+    without one, a random key is generated and exposed as `authkey`.
+    Each connection is authenticated and served in its own thread, so
+    a client that stalls or drops the connection only affects itself.
+    """
+    # Methods of the queue that clients can call directly
+    methods = ("register", "heartbeat", "get_job", "complete", "forget_session", "forgotten_sessions", "status", "submit")
+
+    def __init__(
+            self, 
+            queue: LocalQueue, 
+            address: Tuple[str, int] = ("127.0.0.1", 0), 
+            authkey: bytes = None,
+            backlog: int = 64
+        ):
+        self.queue = queue
+        self.authkey = authkey or secrets.token_bytes(32)
+        # The handshake runs in the connection threads, not in the accepting one
+        self._listener = Listener(address, backlog=backlog)
+        self.address = self._listener.address
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> "SocketQueueServer":
+        """Start accepting connections in a background thread."""
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop accepting connections."""
+        self._stopped.set()
+        self._listener.close()
+
+    def _serve(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                connection = self._listener.accept()
+            except Exception as e:
+                if not self._stopped.is_set():
+                    print(f"Error accepting a connection to the queue: {str(e)}")
+                continue
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection: Connection) -> None:
+        with connection:
+            try:
+                deliver_challenge(connection, self.authkey)
+                answer_challenge(connection, self.authkey)
+                method, args = connection.recv()
+            except Exception as e:
+                print(f"Rejected connection to the queue: {type(e).__name__}: {str(e)}")
+                return
+
+            try:
+                if method == "submit":
+                    # The connection stays open until the job is done, so no result is kept for later
+                    job, = args
+                    value = self.queue.submit(job).result()
+                elif method in self.methods:
+                    value = getattr(self.queue, method)(*args)
+                else:
+                    raise ValueError(f"Method {method} not supported. Available methods: {', '.join(self.methods)}")
+                connection.send(("ok", value))
+            except Exception as e:
+                try:
+                    connection.send(("error", str(e)))
+                except OSError:
+                    pass
+
+class SocketQueue(WorkQueue):
+    """
+    Client of a SocketQueueServer, for workers and agents on other nodes.
+    The authkey has to be the server's `authkey`. Calls fail with a 
+    TimeoutError if the server does not connect or answer within the 
+    timeout, besides the time a call is expected to block for.
+    """
+    def __init__(self, address: Tuple[str, int], authkey: bytes, timeout: float = WORKER_CONNECTION_TIMEOUT):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+
+    def _connect(self) -> Connection:
+        """Open an authenticated connection to the server."""
+        with socket.create_connection(self.address, timeout=self.timeout) as sock:
+            sock.settimeout(None)
+            connection = Connection(sock.detach())
+        try:
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"Queue server at {self.address} did not answer within {self.timeout} seconds")
+            answer_challenge(connection, self.authkey)
+            deliver_challenge(connection, self.authkey)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _call(self, method: str, *args: Any, wait: Optional[float] = 0.0) -> Any:
+        """
+        Call a method of the served queue over a new connection.
+
+        Args:
+            method (str): The name of the method.
+            *args (Any): The arguments of the method.
+            wait (float, optional): The time the method may block on the server, None to wait indefinitely.
+
+        Returns:
+            Any: The return value of the method.
+        """
+        with self._connect() as connection:
+            connection.send((method, args))
+            if not connection.poll(None if wait is None else wait + self.timeout):
+                raise TimeoutError(f"Queue server at {self.address} did not answer {method} in time")
+            status, value = connection.recv()
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+    def submit(self, job: Job) -> Future:
+        future = Future()
+
+        def wait_for_result():
+            try:
+                future.set_result(self._call("submit", job, wait=None))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=wait_for_result, daemon=True).start()
+        return future
+
+    def register(self, worker_id: str, agent_names: List[str]) -> None:
+        self._call("register", worker_id, agent_names)
+
+    def heartbeat(self, worker_id: str) -> bool:
+        return self._call("heartbeat", worker_id)
+
+    def get_job(self, worker_id: str, timeout: float = 1.0) -> Optional[Job]:
+        return self._call("get_job", worker_id, timeout, wait=timeout)
+
+    def complete(self, result: JobResult) -> None:
+        self._call("complete", result)
+
+    def forget_session(self, session_id: str) -> None:
+        self._call("forget_session", session_id)
+
+    def forgotten_sessions(self, worker_id: str) -> List[str]:
+        return self._call("forgotten_sessions", worker_id)
+
+    def status(self) -> Dict[str, Any]:
+        return self._call("status")
+
+class Worker:
+    """
+    Worker running the jobs of a work queue with its own agents,
+    sending heartbeats while it is running.
+    """
+    def __init__(
+            self,
+            queue: WorkQueue,
+            agents: List[AgentFunction],
+            worker_id: str = None,
+            heartbeat_interval: float = WORKER_HEARTBEAT_INTERVAL
+        ):
+        self.queue = queue
+        self.agents = {format_agent_name(agent.__name__): agent for agent in agents}
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.heartbeat_interval = heartbeat_interval
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "Worker":
+        """Register the worker and start running jobs and sending heartbeats in background threads."""
+        self.queue.register(self.worker_id, list(self.agents))
+        self._stopped.clear()
+        self._threads = [
+            threading.Thread(target=self._send_heartbeats, daemon=True),
+            threading.Thread(target=self.run, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop running jobs and sending heartbeats, the running job is finished first."""
+        self._stopped.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _send_heartbeats(self) -> None:
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                if not self.queue.heartbeat(self.worker_id):
+                    self.queue.register(self.worker_id, list(self.agents))
+                for session_id in self.queue.forgotten_sessions(self.worker_id):
+                    self.forget_session(session_id)
+            except Exception as e:
+                print(f"Error sending heartbeat of worker {self.worker_id}: {str(e)}")
+
+    def forget_session(self, session_id: str) -> None:
+        """
+        Release what the agents of the worker keep for a finished session.
+
+        Args:
+            session_id (str): The id of the session.
+        """
+        for agent in self.agents.values():
+            if hasattr(agent, "forget_session"):
+                agent.forget_session(session_id)
+
+    def run(self) -> None:
+        """Run jobs until the worker is stopped. Errors of the queue are printed and retried."""
+        while not self._stopped.is_set():
+            try:
+                job = self.queue.get_job(self.worker_id, timeout=self.heartbeat_interval)
+            except Exception as e:
+                print(f"Error getting a job on worker {self.worker_id}: {str(e)}")
+                self._stopped.wait(self.heartbeat_interval)
+                continue
+            if job is None:
+                continue
+
+            # Retry reporting the outcome, the job stays assigned to the worker until then
+            result = self.run_job(job)
+            while not self._stopped.is_set():
+                try:
+                    self.queue.complete(result)
+                    break
+                except Exception as e:
+                    print(f"Error completing job {job.id} on worker {self.worker_id}: {str(e)}")
+                    self._stopped.wait(self.heartbeat_interval)
+
+    def run_job(self, job: Job) -> JobResult:
+        """
+        Run a job with the matching agent.
+
+        Args:
+            job (Job): The job to run.
+
+        Returns:
+            JobResult: The outcome of the job.
+        """
+        kwargs = {"task": job.task, "context_variables": job.context_variables}
+        if job.history:
+            kwargs["history"] = job.history
+        if job.session_id:
+            kwargs["session_id"] = job.session_id
+
+        try:
+            history = self.agents[format_agent_name(job.agent_name)](**kwargs)
+            return JobResult(job_id=job.id, worker_id=self.worker_id, history=history)
+        except Exception as e:
+            return JobResult(job_id=job.id, worker_id=self.worker_id, error=f"{type(e).__name__}: {e}")
+
+def remote_agent(queue: WorkQueue, name: str, timeout: float = None) -> AgentFunction:
+    """
+    Create an agent function that runs the agent with the given name
+    on the workers of the queue. It can be used wherever an agent is,
+    e.g. in the team of an orchestrator, so that transfer_to_agent
+    runs the sub-agent on another node.
+
+    Args:
+        queue (WorkQueue): The work queue of the workers.
+        name (str): The name of the agent, as registered by the workers.
+        timeout (float, optional): The time to wait for the result, in seconds.
+
+    Returns:
+        AgentFunction: The agent function.
+    """
+    def process(
+            task: str = "",
+            history: List[ChatMessage] = [],
+            context_variables = None,
+            session_id: str = None,
+            **kwargs
+        ) -> List[ChatMessage]:
+        """
+        Process the user query and update the history
+        using remote agent: {name}.
+
+        Args:
+            task (str): The user query.
+            history (List[ChatMessage]): The history of the conversation.
+            context_variables: The context variables passed to the agent.
+            session_id (str): The session of the conversation, its jobs stick to one worker.
+
+        Returns:
+            List[ChatMessage]: The updated history.
+        """
+        job = Job(
+            agent_name=name,
+            task=task,
+            history=history,
+            context_variables=context_variables,
+            session_id=session_id
+        )
+        return queue.submit(job).result(timeout=timeout)
+
+    def forget_session(session_id: str) -> None:
+        """
+        Tell the workers to release what the agent keeps for a finished session.
+
+        Args:
+            session_id (str): The id of the session.
+        """
+        queue.forget_session(session_id)
+
+    process.__name__ = format_agent_name(name)
+    process.__doc__ = process.__doc__.replace("{name}", format_agent_name(name))
+    process.forget_session = forget_session
+    return process
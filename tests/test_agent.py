@@ -0,0 +1,243 @@
+import gc
+import weakref
+import pytest
+from agento import agent as agent_module
+from agento.agent import Agent
+from agento.router import Router
+
+def get_apples(quantity: int) -> list:
+    """Get a certain quantity of apples."""
+    return ["Apple" for _ in range(quantity)]
+
+@pytest.fixture
+def fake_chat(monkeypatch):
+    """Replace the chat client with canned candidates and a canned final answer."""
+    calls = {"candidates": [], "closed": False}
+
+    def chat(history, model, provider, priority):
+        return "Here are your apples."
+
+    def chat_candidates(history, model, provider, n, priority):
+        calls["candidates"].append(n)
+        try:
+            yield "```python\napples = get_apples(\n```"
+            yield "```python\napples = get_apples(quantity)\n```"
+            yield "```python\napples = get_apples(2)\n```"
+            yield "```python\napples = get_apples(3)\n```"
+        finally:
+            calls["closed"] = True
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    monkeypatch.setattr(agent_module, "chat_candidates", chat_candidates)
+    return calls
+
+def test_best_of_n_takes_first_valid_candidate(fake_chat):
+    """Test that the first candidate that compiles and executes without errors is used."""
+    agent = Agent(
+        name="Apple Agent",
+        instructions="You can get apples.",
+        model="test-model",
+        provider="ollama",
+        functions=[get_apples],
+        candidates=4,
+    )
+    history = agent("Get me 2 apples")
+
+    assert fake_chat["candidates"] == [4]
+    assert fake_chat["closed"]
+    assert history[-3].message.content == "```python\napples = get_apples(2)\n```"
+    assert '"get_apples": "apples"' in history[-2].message.content
+    assert history[-1].message.content == "Here are your apples."
+
+def test_best_of_n_falls_back_to_first_candidate(monkeypatch):
+    """Test that the first candidate is used when none of them succeeds."""
+    def chat_candidates(history, model, provider, n, priority):
+        yield "```python\napples = get_apples(\n```"
+        yield "```python\napples = get_apples(quantity)\n```"
+
+    monkeypatch.setattr(agent_module, "chat", lambda *args: "Something went wrong.")
+    monkeypatch.setattr(agent_module, "chat_candidates", chat_candidates)
+    agent = Agent(
+        name="Apple Agent",
+        instructions="You can get apples.",
+        model="test-model",
+        provider="ollama",
+        functions=[get_apples],
+        candidates=2,
+    )
+    history = agent("Get me apples")
+
+    assert history[-3].message.content == "```python\napples = get_apples(\n```"
+    assert '"errors": [' in history[-2].message.content
+
+def test_best_of_n_refused_with_team():
+    """Test that an orchestrator cannot request several candidates."""
+    with pytest.raises(ValueError):
+        Agent(
+            name="Apple Agent",
+            instructions="You can transfer the task to the seller agent.",
+            model="test-model",
+            provider="ollama",
+            team=[Agent(name="Seller Agent", instructions="You sell apples.", model="test-model", provider="ollama")],
+            candidates=2,
+        )
+
+@pytest.fixture
+def team_chat(monkeypatch):
+    """Replace the chat client with canned responses for an orchestrator and a seller agent."""
+    calls = {"orchestrator": 0, "seller": 0}
+
+    def chat(history, model, provider, priority):
+        calls[model] += 1
+        finished = history[-1].message.content.startswith("<|function_results|>")
+        if model == "orchestrator":
+            return "Done." if finished else "```python\nresults, history = transfer_to_agent('Sell the apples', 'seller_agent')\n```"
+        return "Sold for $3." if finished else "```python\nmoney = sell()\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    return calls
+
+def create_team(router):
+    def sell() -> str:
+        """Sell the apples."""
+        return "$3"
+
+    seller_agent = Agent(
+        name="Seller Agent",
+        instructions="You sell apples.",
+        model="seller",
+        provider="ollama",
+        functions=[sell],
+    )
+    return Agent(
+        name="Apple Agent",
+        instructions="You can transfer the task to the seller agent.",
+        model="orchestrator",
+        provider="ollama",
+        team=[seller_agent],
+        router=router,
+    )
+
+def test_router_caches_orchestrator_decision(team_chat):
+    """Test that a transfer decision is cached and reused for a similar task."""
+    router = Router()
+    agent = create_team(router)
+
+    history = agent("Sell 3 apples")
+    assert team_chat == {"orchestrator": 2, "seller": 2}
+    assert history[-1].message.content == "Done."
+    assert router.stats() == {"rule_hits": 0, "cache_hits": 0, "misses": 1, "hits": 0, "cache_size": 1}
+
+    history = agent("sell 4 apples!")
+    assert team_chat == {"orchestrator": 2, "seller": 4}
+    assert history[-1].sender == "Apple Agent"
+    assert history[-1].message.content == "Sold for $3."
+    assert all(not message.include_in_chat for message in history[2:-1])
+    assert router.stats()["cache_hits"] == 1
+
+def test_router_rule_dispatches_to_team_member(team_chat):
+    """Test that a matching rule skips the orchestrator."""
+    router = Router().add_rule("Seller Agent", keywords=["sell"])
+    agent = create_team(router)
+
+    history = agent("Please sell my apples")
+    assert team_chat == {"orchestrator": 0, "seller": 2}
+    assert history[-1].message.content == "Sold for $3."
+    assert router.stats()["rule_hits"] == 1
+
+def test_router_does_not_learn_from_failed_transfers(monkeypatch):
+    """Test that a turn with errors is not cached."""
+    def chat(history, model, provider, priority):
+        if history[-1].message.content.startswith("<|function_results|>"):
+            return "Something went wrong."
+        if model == "orchestrator":
+            return "```python\nresults, history = transfer_to_agent('Sell the apples', 'seller_agent')\nmoney = results.missing\n```"
+        return "```python\nmoney = sell()\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    router = Router()
+    agent = create_team(router)
+
+    agent("Sell 3 apples")
+    assert router.stats()["cache_size"] == 0
+
+def test_forget_session_releases_context_variables(monkeypatch):
+    """Test that the large context variables of a session are released when it is forgotten."""
+    class Apples(list):
+        pass
+
+    def chat(history, model, provider, priority):
+        if history[-1].message.content.startswith("<|function_results|>"):
+            return "Counted."
+        return "```python\ncount = len(apples)\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    agent = Agent(name="Apple Agent", instructions="You can count apples.", model="test-model", provider="ollama")
+
+    apples = Apples(["Apple"] * 1000)
+    history = agent("Count my apples", history=[], context_variables={"apples": apples}, session_id="session-1")
+    assert "<handle:apples Apples len=1000" in history[0].message.content
+    assert '"count": 1000' in history[-2].message.content
+
+    # Without a session the context variables are rendered as they are and nothing is stored
+    history = agent("Count my apples", history=[], context_variables={"apples": Apples(["Apple"] * 30)})
+    assert "<handle:apples" not in history[0].message.content
+
+    reference = weakref.ref(apples)
+    del apples
+    gc.collect()
+    assert reference() is not None  # Kept alive by the store of the session
+
+    agent.forget_session("session-1")
+    gc.collect()
+    assert reference() is None
+
+def test_transfer_transcript_and_derived_histories(monkeypatch):
+    """Test that only the messages the team member produced are merged, and histories derived by the code are dropped."""
+    def chat(history, model, provider, priority):
+        done = history[-1].message.content.startswith("<|function_results|>")
+        if model == "seller-model":
+            return "Sold 2 apples." if done else "```python\napples = get_apples(2)\n```"
+        return "Done." if done else "```python\nanswer, history = transfer_to_agent('Sell', 'seller_agent')\nsteps = history[2:]\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    seller = Agent(name="Seller Agent", instructions="You can sell apples.", model="seller-model", provider="ollama", functions=[get_apples])
+    agent = Agent(name="Apple Agent", instructions="You can transfer tasks.", model="test-model", provider="ollama", team=[seller])
+
+    history = agent("Sell my apples", history=[])
+    transcript = [message for message in history if not message.include_in_chat]
+    assert [message.message.content for message in transcript] == [
+        "```python\napples = get_apples(2)\n```",
+        transcript[1].message.content,
+        "Sold 2 apples.",
+    ]
+    assert transcript[1].message.content.startswith("<|function_results|>")
+    assert '"answer": "Sold 2 apples."' in history[-2].message.content
+    assert '"steps"' not in history[-2].message.content
+    assert history[-1].message.content == "Done."
+
+def test_forget_session_releases_team_member_context_variables(monkeypatch):
+    """Test that forgetting a session also releases the large context variables passed on to the team."""
+    class Apples(list):
+        pass
+
+    def chat(history, model, provider, priority):
+        done = history[-1].message.content.startswith("<|function_results|>")
+        if model == "seller-model":
+            return "Sold." if done else "```python\nsold = len(apples)\n```"
+        return "Done." if done else "```python\nanswer, history = transfer_to_agent('Sell', 'seller_agent', {'apples': apples})\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    seller = Agent(name="Seller Agent", instructions="You can sell apples.", model="seller-model", provider="ollama")
+    agent = Agent(name="Apple Agent", instructions="You can transfer tasks.", model="test-model", provider="ollama", team=[seller])
+
+    apples = Apples(["Apple"] * 1000)
+    agent("Sell my apples", history=[], context_variables={"apples": apples}, session_id="session-1")
+    reference = weakref.ref(apples)
+    del apples
+    gc.collect()
+    assert reference() is not None
+
+    agent.forget_session("session-1")
+    gc.collect()
+    assert reference() is None
@@ -1,5 +1,6 @@
+import time
 import pytest
-from agento.engine import execute_python_code, process_results
+from agento.engine import TranscriptCollector, execute_python_code, process_results
 from agento.client import ChatCompletionMessage, ChatMessage
 
 def test_execute_python_code_basic():
@@ -41,6 +42,78 @@ def test_execute_python_code_with_functions_and_context():
     assert output['variables'] == {'message': 'Hello, Bob!', 'location': 'Living in New York', 'name': 'Bob', 'city': 'New York'}
     assert output['function_results'] == {'greet': 'message'}
 
+def test_execute_python_code_parallel():
+    """Test that independent function calls run concurrently with the same results."""
+    def fetch(record_id):
+        time.sleep(0.2)
+        return {'id': record_id}
+
+    def combine(*records):
+        return [record['id'] for record in records]
+
+    code = "ids = [1, 2, 3]\na = fetch(ids[0])\nb = fetch(2)\nc = fetch(record_id=3)\nall_ids = combine(a, b, c)"
+    start = time.monotonic()
+    output = execute_python_code(code, functions=[fetch, combine], parallel=True)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.5
+    assert output == execute_python_code(code, functions=[fetch, combine])
+    assert output['variables']['all_ids'] == [1, 2, 3]
+    assert output['errors'] == []
+
+def test_execute_python_code_parallel_keeps_dependencies():
+    """Test that dependent calls and failing calls behave as in sequential execution."""
+    order = []
+    def step(value):
+        order.append(value)
+        if value == 'boom':
+            raise ValueError('Step failed')
+        return value + 1
+
+    output = execute_python_code("a = step(1)\nb = step(a)\na = step(10)", functions=[step], parallel=True)
+    assert output['variables'] == {'a': 11, 'b': 3}
+    assert order == [1, 2, 10]
+
+    output = execute_python_code("x = step(1)\ny = step('boom')\nz = step(5)", functions=[step], parallel=True)
+    assert output['variables'] == {'x': 2}
+    assert output['errors'] == ['Step failed']
+
+    # Failing arguments of a later call do not keep the earlier calls from running
+    order.clear()
+    output = execute_python_code("a = step(1)\nb = step(undefined_name)", functions=[step], parallel=True)
+    assert output['variables'] == {'a': 2}
+    assert output['function_results'] == {'step': 'a'}
+    assert order == [1]
+    assert output['errors'] == ["name 'undefined_name' is not defined"]
+
+def test_execute_python_code_parallel_shared_mutable_argument():
+    """Test that calls sharing a mutable argument run sequentially."""
+    def add(items, item):
+        time.sleep(0.1)
+        items.append(item)
+        return len(items)
+
+    def count(items):
+        return len(items)
+
+    code = "items = []\na = add(items, 1)\nb = count(items)"
+    output = execute_python_code(code, functions=[add, count], parallel=True)
+    assert output == execute_python_code(code, functions=[add, count])
+    assert output['variables'] == {'items': [1], 'a': 1, 'b': 1}
+
+def test_execute_python_code_parallel_transfers_run_sequentially():
+    """Test that transfers to agents are not run concurrently."""
+    order = []
+    def transfer_to_agent(task, agent_name):
+        time.sleep(0.1 if agent_name == 'first' else 0)
+        order.append(agent_name)
+        return task
+
+    code = "a = transfer_to_agent('Sell', 'first')\nb = transfer_to_agent('Buy', 'second')"
+    output = execute_python_code(code, functions=[transfer_to_agent], parallel=True)
+    assert order == ['first', 'second']
+    assert output['variables'] == {'a': 'Sell', 'b': 'Buy'}
+
 def test_process_results_basic():
     """Test the processing of results without chat messages or history."""
     results = {
@@ -63,20 +136,24 @@ def test_process_results_with_transfer_to_agent():
     assert chat_messages == []
 
 def test_process_results_with_chat_messages():
-    """Test the processing of results with chat messages."""
+    """Test the processing of results with transcripts reported through the collector."""
     chat_messages = [
         ChatMessage(sender="system", message=ChatCompletionMessage(role="system", content="System message")),
         ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content="User message")),
         ChatMessage(sender="assistant", message=ChatCompletionMessage(role="assistant", content="Assistant message")),
         ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content="Another user message")),
     ]
+    returned = ("Another user message", chat_messages)
+    transcripts = TranscriptCollector()
+    transcripts.record("seller_agent", chat_messages[2:], returned, chat_messages)
     results = {
         'function_results': {},
-        'variables': {'messages': chat_messages, 'x': 5}
+        'variables': {'result': returned, 'messages': chat_messages, 'x': 5}
     }
-    processed_results, extracted_messages = process_results(results)
+    processed_results, extracted_messages = process_results(results, transcripts)
     assert processed_results['variables'] == {'x': 5}
     assert extracted_messages == chat_messages[2:]
+    assert transcripts.agents == ["seller_agent"]
 
 def test_process_results_with_history():
     """Test the processing of results with history."""
@@ -93,6 +170,27 @@ def test_process_results_with_history():
     assert extracted_messages == []  # Expecting an empty list of extracted messages
     assert 'history' not in processed_results['variables']  # Ensure history is removed from variables
 
+def test_execute_python_code_with_transfer_collector():
+    """Test that a transfer reports its transcript through the collector."""
+    transcripts = TranscriptCollector()
+    sub_history = [
+        ChatMessage(sender="system", message=ChatCompletionMessage(role="system", content="System message")),
+        ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content="Sell the apples")),
+        ChatMessage(sender="seller_agent", message=ChatCompletionMessage(role="assistant", content="Sold")),
+    ]
+
+    def transfer_to_agent(task, agent_name, context_variables=None):
+        returned = (sub_history[-1].message.content, sub_history)
+        transcripts.record(agent_name, sub_history[2:], returned, sub_history)
+        return returned
+
+    code = "results, history = transfer_to_agent('Sell the apples', 'seller_agent')\nx = 1"
+    output = execute_python_code(code, functions=[transfer_to_agent])
+    processed_results, extracted_messages = process_results(output, transcripts)
+    assert processed_results['variables'] == {'results': 'Sold', 'x': 1}
+    assert processed_results['function_results']['transfer_to_agent'] == 'Sold'
+    assert extracted_messages == sub_history[2:]
+
 def test_process_results_with_invalid_input():
     """Test the processing of results with invalid input."""
     with pytest.raises(ValueError):
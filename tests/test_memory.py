@@ -0,0 +1,55 @@
+import pytest
+from agento.memory import MemoryProfiler
+
+@pytest.fixture
+def profiler():
+    profiler = MemoryProfiler(threshold=500_000)
+    yield profiler
+    profiler.stop()
+
+def test_memory_attributed_to_session_agent_and_execution(profiler):
+    """Test that retained and peak bytes are attributed to the enclosing scopes."""
+    kept = []
+    with profiler.track("Apple Agent", "session-1"):
+        with profiler.track(execution=True):
+            kept.append(bytearray(1_000_000))
+            temporary = bytearray(2_000_000)
+            del temporary
+
+    stats = profiler.stats()
+    session = stats["sessions"]["session-1"]
+    agent = session["agents"]["Apple Agent"]
+    execution = stats["executions"][-1]
+
+    assert execution["session"] == "session-1" and execution["agent"] == "Apple Agent"
+    assert 1_000_000 <= execution["retained"] < 1_500_000
+    assert execution["peak"] >= 3_000_000
+    assert agent["turns"] == 1 and agent["executions"] == 1
+    assert 1_000_000 <= agent["current"] < 1_500_000
+    assert agent["peak"] >= 3_000_000
+    assert session["current"] == agent["current"]
+    assert session["peak"] >= 3_000_000
+
+def test_nested_agent_counts_once_towards_session(profiler):
+    """Test that a sub-agent turn within the same session is not counted twice."""
+    kept = []
+    with profiler.track("Apple Agent", "session-1"):
+        with profiler.track("Seller Agent"):
+            kept.append(bytearray(1_000_000))
+
+    session = profiler.stats()["sessions"]["session-1"]
+    assert session["agents"]["Seller Agent"]["current"] >= 1_000_000
+    assert session["agents"]["Apple Agent"]["current"] >= 1_000_000
+    assert session["current"] < 1_500_000
+
+def test_sessions_over_threshold_are_flagged(profiler):
+    """Test that only the sessions retaining more than the threshold are flagged."""
+    kept = []
+    with profiler.track("Apple Agent", "small"):
+        kept.append(bytearray(1_000))
+    with profiler.track("Apple Agent", "large"):
+        kept.append(bytearray(1_000_000))
+
+    assert profiler.flagged_sessions() == ["large"]
+    profiler.forget("large")
+    assert profiler.flagged_sessions() == []
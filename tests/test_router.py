@@ -0,0 +1,33 @@
+import pytest
+from agento.router import Router, normalize_task
+
+def test_normalize_task():
+    assert normalize_task("Sell 3 apples, please!") == "sell # apples please"
+    assert normalize_task("  sell   4.5 APPLES please") == "sell # apples please"
+
+def test_router_rules():
+    router = Router()
+    router.add_rule("Seller Agent", keywords=["sell", "price"])
+    router.add_rule("Buyer Agent", pattern=r"\bbuy(ing)?\b")
+
+    assert router.route("What is the PRICE of apples?", ["seller_agent", "buyer_agent"]) == "seller_agent"
+    assert router.route("I am buying apples", ["seller_agent", "buyer_agent"]) == "buyer_agent"
+    assert router.route("Eat the apples", ["seller_agent", "buyer_agent"]) is None
+    assert router.route("Sell the apples", ["buyer_agent"]) is None  # Unavailable agents are skipped
+    assert router.stats() == {"rule_hits": 2, "cache_hits": 0, "misses": 2, "hits": 2, "cache_size": 0}
+
+def test_router_rule_without_keywords_or_pattern():
+    with pytest.raises(ValueError):
+        Router().add_rule("Seller Agent")
+
+def test_router_cache():
+    router = Router(cache_size=2)
+    router.learn("Sell 3 apples", "Seller Agent")
+    router.learn("Eat 1 apple", "eater_agent")
+
+    assert router.route("sell 10 apples", ["seller_agent"]) == "seller_agent"
+    router.learn("Buy 2 apples", "buyer_agent")  # Evicts the least recently used entry
+
+    assert router.route("Eat 1 apple", ["eater_agent"]) is None
+    assert router.route("Sell 3 apples", ["seller_agent"]) == "seller_agent"
+    assert router.stats() == {"rule_hits": 0, "cache_hits": 2, "misses": 1, "hits": 2, "cache_size": 2}
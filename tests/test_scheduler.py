@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from agento import scheduler
+from agento.settings import PROVIDER_URLS
+from agento.scheduler import Priority, ProviderScheduler, set_rate_limits, get_scheduler
+from agento.client import ChatCompletionMessage, ChatMessage, chat, chat_candidates
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI compatible chat completions endpoint."""
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        delays = getattr(self.server, "delays", [])
+        time.sleep(delays.pop(0) if delays else 0)
+        content = body["messages"][-1]["content"]
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"Echo: {content}"},
+            }],
+            "usage": {"prompt_tokens": 40, "completion_tokens": 10, "total_tokens": 50},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(PROVIDER_URLS, "stub", (f"http://127.0.0.1:{server.server_address[1]}/v1", "stub"))
+    yield server
+    scheduler._schedulers.pop("stub", None)
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def stub_provider(stub_server):
+    return "stub"
+
+def user_message(content: str) -> ChatMessage:
+    return ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content=content))
+
+def test_chat_through_stub_server(stub_provider):
+    """Test that a chat completion goes through the scheduler of the provider."""
+    response = chat([user_message("Hello")], "stub-model", stub_provider)
+    assert response == "Echo: Hello"
+    metrics = get_scheduler(stub_provider).metrics()
+    assert metrics["requests"]["interactive"] == 1
+    assert metrics["queue_depth"] == 0
+
+def test_requests_per_second_limit(stub_provider):
+    """Test that the requests beyond the burst are spaced by the request rate."""
+    set_rate_limits(stub_provider, requests_per_second=5)
+    start = time.monotonic()
+    threads = [threading.Thread(target=chat, args=([user_message("Hi")], "stub-model", stub_provider)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    metrics = get_scheduler(stub_provider).metrics()
+    assert elapsed >= 0.5
+    assert metrics["requests"]["interactive"] == 8
+    assert metrics["max_queue_depth"] > 1
+    assert metrics["max_wait_time"]["interactive"] > 0
+
+def test_tokens_per_minute_settled_with_usage(stub_provider):
+    """Test that the token bucket is charged with the usage reported by the provider."""
+    provider_scheduler = set_rate_limits(stub_provider, tokens_per_minute=6000)
+    chat([user_message("Hi")], "stub-model", stub_provider)
+    assert 5940 <= provider_scheduler.tokens.tokens <= 5960
+
+def test_interactive_requests_served_before_batch():
+    """Test that a waiting interactive request overtakes a waiting batch request."""
+    provider_scheduler = ProviderScheduler(requests_per_second=4)
+    for _ in range(4):
+        provider_scheduler.acquire()
+
+    order = []
+    def acquire(priority):
+        provider_scheduler.acquire(priority)
+        order.append(priority)
+
+    batch = threading.Thread(target=acquire, args=(Priority.BATCH,))
+    batch.start()
+    while provider_scheduler.metrics()["queue_depth"] < 1:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=acquire, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    batch.join()
+    interactive.join()
+
+    assert order == [Priority.INTERACTIVE, Priority.BATCH]
+    metrics = provider_scheduler.metrics()
+    assert metrics["requests"] == {"interactive": 5, "batch": 1}
+    assert metrics["max_queue_depth"] == 2
+
+def test_unknown_provider():
+    """Test that an unknown provider is rejected."""
+    with pytest.raises(ValueError):
+        get_scheduler("unknown")
+
+def test_chat_candidates_cancels_remaining_requests(stub_server, stub_provider):
+    """Test that closing the candidates aborts the requests still in flight."""
+    stub_server.delays = [0, 1, 1, 1]
+    provider_scheduler = set_rate_limits(stub_provider, tokens_per_minute=60000)
+    settled = []
+    settle = provider_scheduler.settle
+    provider_scheduler.settle = lambda estimated, used: settled.append(used) or settle(estimated, used)
+
+    candidates = chat_candidates([user_message("Hi")], "stub-model", stub_provider, 4)
+    assert next(candidates) == "Echo: Hi"
+    candidates.close()
+    time.sleep(1.5)
+
+    # Only the taken candidate got a response, the others were aborted before theirs and are not counted
+    assert settled == [50]
+    assert provider_scheduler.metrics()["requests"]["interactive"] == 1
+    assert 59940 <= provider_scheduler.tokens.tokens <= 59960
+
+def test_chat_candidates_cancels_waiting_requests(stub_provider):
+    """Test that closing the candidates drops the requests still waiting for the rate limits."""
+    provider_scheduler = set_rate_limits(stub_provider, requests_per_second=1)
+    candidates = chat_candidates([user_message("Hi")], "stub-model", stub_provider, 4)
+    assert next(candidates) == "Echo: Hi"
+    candidates.close()
+
+    # The next request does not wait behind the abandoned candidates
+    start = time.monotonic()
+    chat([user_message("Hello")], "stub-model", stub_provider)
+    assert time.monotonic() - start < 1.5
+    assert provider_scheduler.metrics()["requests"]["interactive"] == 2
+    assert provider_scheduler.metrics()["queue_depth"] == 0
+
+def test_cancel_waiting_request():
+    """Test that a cancelled request leaves the queue without being charged or counted."""
+    provider_scheduler = ProviderScheduler(requests_per_second=1)
+    provider_scheduler.acquire()
+    cancelled = threading.Event()
+    outcome = []
+    waiting = threading.Thread(target=lambda: outcome.append(provider_scheduler.acquire(cancelled=cancelled)))
+    waiting.start()
+    while provider_scheduler.metrics()["queue_depth"] < 1:
+        time.sleep(0.001)
+    provider_scheduler.cancel(cancelled)
+    waiting.join(timeout=1)
+
+    assert outcome == [None]
+    metrics = provider_scheduler.metrics()
+    assert metrics["requests"]["interactive"] == 1
+    assert metrics["queue_depth"] == 0
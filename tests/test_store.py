@@ -0,0 +1,53 @@
+from agento.store import ObjectStore, create_preview
+from agento.engine import execute_python_code, process_results
+from agento.utils import load_system_prompt
+
+def test_create_preview():
+    assert create_preview(["Apple"] * 100) == "['Apple', 'Apple', 'Apple', ...]"
+    assert create_preview({"a": 1, "b": 2}) == "{'a': 1, 'b': 2}"
+    assert create_preview(("x",)) == "('x',)"
+    assert create_preview(set()) == "set()"
+    assert create_preview([list(range(10 ** 6))]) == "[[0, 1, 2, ...]]"  # Nested items are previewed too
+    assert create_preview({"a": {"b": [1, [2]]}}) == "{'a': {'b': [...]}}"
+    assert create_preview("x" * 100) == "'" + "x" * 39 + "..."
+
+def test_render_small_and_large_values():
+    store = ObjectStore(max_items=3)
+    apples = ["Apple"] * 1000
+    rendered = store.render({"apples": apples, "name": "Bob", "ids": [1, 2]})
+
+    assert rendered == "{'apples': <handle:apples list len=1000 preview=['Apple', 'Apple', 'Apple', ...]>, 'name': 'Bob', 'ids': [1, 2]}"
+    assert store.get("apples") is apples
+    assert store.handle_of(apples).key == "apples"
+    assert store.handle_of(list(apples)) is None  # Looked up by identity, not equality
+
+def test_put_replaces_previous_value():
+    store = ObjectStore(max_items=3)
+    first, second = ["Apple"] * 10, ["Pear"] * 10
+    store.put("fruits", first)
+    store.put("fruits", second)
+
+    assert store.get("fruits") is second
+    assert store.handle_of(first) is None
+    assert store.handle_of(second).preview == "['Pear', 'Pear', 'Pear', ...]"
+
+def test_large_context_variables_by_handle(tmp_path):
+    store = ObjectStore(max_items=3)
+    apples = ["Apple"] * 1000
+    context_variables = {"apples": apples}
+
+    prompt_file = tmp_path / "system_prompt.txt"
+    prompt_file.write_text("{{context_variables}}")
+    prompt = load_system_prompt(context_variables=context_variables, file_path=str(prompt_file), store=store)
+    assert prompt == "{'apples': <handle:apples list len=1000 preview=['Apple', 'Apple', 'Apple', ...]>}"
+
+    seen = []
+    def count_apples(apples: list) -> int:
+        seen.append(apples)
+        return len(apples)
+
+    output = execute_python_code("count = count_apples(apples)", functions=[count_apples], context_variables=context_variables)
+    processed_results, _ = process_results(output, store=store)
+
+    assert seen[0] is apples  # The code gets the live object
+    assert processed_results["variables"] == {"apples": str(store.handle_of(apples)), "count": 1000}
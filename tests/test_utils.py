@@ -1,5 +1,6 @@
 import pytest
-from agento.utils import extract_python_code, create_functions_schema, load_system_prompt
+import json
+from agento.utils import extract_python_code, create_functions_schema, load_system_prompt, schema_token_counts
 
 def test_extract_python_code():
     content = "Some text\n```python\nx = 10\ny = 20\nprint(x + y)\n```\n"
@@ -29,6 +30,51 @@ def test_create_functions_schema():
     assert "str" in schema
     assert "bool" in schema
 
+def documented_function(quantity: int, name: str) -> list:
+    """
+    Get a certain quantity of named apples.
+
+    Args:
+        quantity (int): The quantity of apples to get.
+        name (str): The name of the apples.
+
+    Returns:
+        list: A list of apples.
+    """
+    pass
+
+def test_create_functions_schema_encodings():
+    compact = create_functions_schema([documented_function], encoding="compact")
+    assert json.loads(compact) == json.loads(create_functions_schema([documented_function]))
+    assert "\n  " not in compact
+
+    stub = create_functions_schema([documented_function], encoding="stub")
+    assert stub.startswith("def documented_function(quantity: int, name: str) -> list:")
+    assert "quantity (int): The quantity of apples to get." in stub
+
+    summary = create_functions_schema([documented_function], encoding="stub", summary_only=True)
+    assert summary == 'def documented_function(quantity: int, name: str) -> list:\n    """Get a certain quantity of named apples."""'
+
+    with pytest.raises(ValueError):
+        create_functions_schema([documented_function], encoding="yaml")
+
+def test_create_functions_schema_cached_per_function():
+    docstring = documented_function.__doc__
+    first = create_functions_schema([documented_function], encoding="compact", summary_only=True)
+    documented_function.__doc__ = "Get apples."
+    try:
+        second = create_functions_schema([documented_function], encoding="compact", summary_only=True)
+    finally:
+        documented_function.__doc__ = docstring
+    assert "Get a certain quantity of named apples." in first
+    assert json.loads(second)[0]["description"] == "Get apples."
+
+def test_schema_token_counts():
+    counts = schema_token_counts([documented_function])
+    assert set(counts) == {"json", "compact", "stub"}
+    assert counts["compact"]["full"] < counts["json"]["full"]
+    assert counts["stub"]["summary"] < counts["stub"]["full"] < counts["compact"]["full"]
+
 @pytest.fixture
 def mock_system_prompt_file(tmp_path):
     content = """{{prompt_beginning}}
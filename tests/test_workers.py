@@ -0,0 +1,218 @@
+import socket
+import threading
+import time
+import pytest
+from multiprocessing import AuthenticationError
+from agento.client import ChatCompletionMessage, ChatMessage
+from agento.utils import format_agent_name
+from agento.workers import Job, LocalQueue, SocketQueue, SocketQueueServer, Worker, remote_agent
+
+def create_agent(name: str, label: str):
+    """Create a fake agent answering with its label, the task and its context variables."""
+    def process(task="", history=[], context_variables=None, session_id=None):
+        if task == "fail":
+            raise ValueError("Cannot do that")
+        return history + [
+            ChatMessage(sender="user", message=ChatCompletionMessage(role="user", content=task)),
+            ChatMessage(sender=name, message=ChatCompletionMessage(role="assistant", content=f"{label}: {task} {context_variables or ''}".strip())),
+        ]
+    process.__name__ = format_agent_name(name)
+    return process
+
+@pytest.fixture
+def queue():
+    return LocalQueue(heartbeat_timeout=0.5)
+
+@pytest.fixture
+def workers():
+    started = []
+    yield started
+    for worker in started:
+        worker.stop()
+
+def test_remote_agent_runs_on_worker(queue, workers):
+    """Test that a remote agent runs the job on a worker and returns the history."""
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    seller_agent = remote_agent(queue, "Seller Agent", timeout=5)
+
+    history = seller_agent(task="Sell the apples", context_variables={"apples": ["Apple"]})
+    assert seller_agent.__name__ == "seller_agent"
+    assert history[-1].message.content == "worker-1: Sell the apples {'apples': ['Apple']}"
+
+    with pytest.raises(RuntimeError, match="ValueError: Cannot do that"):
+        seller_agent(task="fail")
+
+def test_session_affinity(queue, workers):
+    """Test that the jobs of a session stick to the worker that ran it first."""
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-2")], heartbeat_interval=0.05).start())
+    seller_agent = remote_agent(queue, "Seller Agent", timeout=5)
+
+    labels = {
+        session_id: {seller_agent(task="Sell", session_id=session_id)[-1].message.content for _ in range(5)}
+        for session_id in ["session-1", "session-2", "session-3"]
+    }
+    assert all(len(session_labels) == 1 for session_labels in labels.values())
+    assert set(queue.status()["sessions"]) == {"session-1", "session-2", "session-3"}
+
+def test_jobs_of_dead_worker_are_queued_again(queue, workers):
+    """Test that a job taken by a worker that stopped sending heartbeats runs on another worker."""
+    queue.register("dead-worker", ["Seller Agent"])
+    future = queue.submit(Job(agent_name="Seller Agent", task="Sell", session_id="session-1"))
+    assert queue.get_job("dead-worker", timeout=1).task == "Sell"
+    assert queue.status()["running"] == 1
+
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], worker_id="worker-1", heartbeat_interval=0.05).start())
+    history = future.result(timeout=5)
+    assert history[-1].message.content == "worker-1: Sell"
+    assert queue.status()["workers"] == ["worker-1"]
+    assert queue.status()["sessions"] == {"session-1": "worker-1"}
+
+def test_socket_queue(queue, workers):
+    """Test that workers and agents on other nodes use the queue through a socket."""
+    server = SocketQueueServer(queue).start()
+    try:
+        worker_queue = SocketQueue(server.address, server.authkey)
+        workers.append(Worker(worker_queue, [create_agent("Seller Agent", "remote-worker")], heartbeat_interval=0.05).start())
+
+        seller_agent = remote_agent(SocketQueue(server.address, server.authkey), "Seller Agent", timeout=5)
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(seller_agent(task=f"Sell {i}")[-1].message.content)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == ["remote-worker: Sell 0", "remote-worker: Sell 1", "remote-worker: Sell 2"]
+        assert worker_queue.status()["workers"] == [workers[0].worker_id]
+    finally:
+        for worker in workers:
+            worker.stop()
+        workers.clear()
+        server.stop()
+
+def test_socket_queue_requires_authkey(queue):
+    """Test that the server generates a random authkey and rejects clients without it."""
+    server = SocketQueueServer(queue).start()
+    try:
+        assert len(server.authkey) == 32
+        assert SocketQueueServer(queue).authkey != server.authkey
+        with pytest.raises(AuthenticationError):
+            SocketQueue(server.address, b"wrong").status()
+        assert SocketQueue(server.address, server.authkey).status()["workers"] == []
+    finally:
+        server.stop()
+
+def test_socket_queue_survives_bad_connections(queue):
+    """Test that connections dropped or stalled before authenticating do not stop the server."""
+    server = SocketQueueServer(queue).start()
+    try:
+        socket.create_connection(server.address).close()
+        idle = socket.create_connection(server.address)
+        assert SocketQueue(server.address, server.authkey, timeout=2).status()["workers"] == []
+        idle.close()
+    finally:
+        server.stop()
+
+def test_socket_queue_times_out():
+    """Test that a call to a server that does not answer fails instead of hanging."""
+    with socket.create_server(("127.0.0.1", 0)) as silent_server:
+        with pytest.raises(TimeoutError):
+            SocketQueue(silent_server.getsockname(), b"key", timeout=0.2).status()
+
+def test_idle_sessions_are_dropped(workers):
+    """Test that a session no longer sticks to its worker after the session timeout."""
+    queue = LocalQueue(heartbeat_timeout=0.5, session_timeout=0.2)
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    seller_agent = remote_agent(queue, "Seller Agent", timeout=5)
+
+    seller_agent(task="Sell", session_id="session-1")
+    assert set(queue.status()["sessions"]) == {"session-1"}
+    time.sleep(0.3)
+    assert queue.status()["sessions"] == {}
+
+def test_worker_retries_failing_queue(queue, workers):
+    """Test that a worker keeps running jobs after the queue failed to hand one out."""
+    class FlakyQueue(LocalQueue):
+        failures = 2
+
+        def get_job(self, worker_id, timeout=1.0):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("Queue unreachable")
+            return super().get_job(worker_id, timeout)
+
+    flaky_queue = FlakyQueue(heartbeat_timeout=0.5)
+    workers.append(Worker(flaky_queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    seller_agent = remote_agent(flaky_queue, "Seller Agent", timeout=5)
+    assert seller_agent(task="Sell")[-1].message.content == "worker-1: Sell"
+    assert flaky_queue.failures == 0
+
+def test_orchestrator_transfers_to_remote_agent(queue, workers, monkeypatch):
+    """Test that transfer_to_agent runs a remote team member on a worker."""
+    from agento import agent as agent_module
+    from agento.agent import Agent
+
+    def chat(history, model, provider, priority):
+        if history[-1].message.content.startswith("<|function_results|>"):
+            return "Done."
+        return "```python\nresults, history = transfer_to_agent('Sell the apples', 'seller_agent', {'apples': ['Apple']})\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    agent = Agent(
+        name="Apple Agent",
+        instructions="You can transfer the task to the seller agent.",
+        model="orchestrator",
+        provider="ollama",
+        team=[remote_agent(queue, "Seller Agent", timeout=5)],
+    )
+
+    history = agent("Sell my apples")
+    assert history[-1].message.content == "Done."
+    assert '"results": "worker-1: Sell the apples {\'apples\': [\'Apple\']}"' in history[-2].message.content
+
+def test_orchestrator_keeps_session_affinity(queue, workers, monkeypatch):
+    """Test that transfers of an orchestrator's session stick to one worker."""
+    from agento import agent as agent_module
+    from agento.agent import Agent
+
+    def chat(history, model, provider, priority):
+        if history[-1].message.content.startswith("<|function_results|>"):
+            return "Done."
+        return "```python\nresults, history = transfer_to_agent('Sell', 'seller_agent')\n```"
+
+    monkeypatch.setattr(agent_module, "chat", chat)
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-1")], heartbeat_interval=0.05).start())
+    workers.append(Worker(queue, [create_agent("Seller Agent", "worker-2")], heartbeat_interval=0.05).start())
+    agent = Agent(
+        name="Apple Agent",
+        instructions="You can transfer the task to the seller agent.",
+        model="orchestrator",
+        provider="ollama",
+        team=[remote_agent(queue, "Seller Agent", timeout=5)],
+    )
+
+    labels = set()
+    for _ in range(5):
+        history = agent("Sell my apples", history=[], session_id="session-1")
+        labels.add(history[-2].message.content.split('"results": "')[1].split(":")[0])
+    assert len(labels) == 1
+    assert set(queue.status()["sessions"]) == {"session-1"}
+
+def test_remote_agent_forgets_session_on_workers(queue, workers):
+    """Test that forgetting a session of a remote agent reaches the agents on the workers."""
+    forgotten = []
+    seller_agent = create_agent("Seller Agent", "worker-1")
+    seller_agent.forget_session = forgotten.append
+    workers.append(Worker(queue, [seller_agent], heartbeat_interval=0.05).start())
+    remote_seller = remote_agent(queue, "Seller Agent", timeout=5)
+
+    remote_seller(task="Sell", session_id="session-1")
+    remote_seller.forget_session("session-1")
+    deadline = time.monotonic() + 2
+    while not forgotten and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert forgotten == ["session-1"]
+    assert queue.status()["sessions"] == {}